@@ -1,26 +1,33 @@
-import json
+import ijson
+import orjson
 
-print("Loading checkpoint...")
-with open('trainingData_checkpoint.json', 'r') as f:
-    checkpoint = json.load(f)
+SOURCES = ['trainingData_checkpoint.json', 'trainingData_full.json']
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024  # Fewer write syscalls for the large merged file
 
-print("Loading full...")
-with open('trainingData_full.json', 'r') as f:
-    full = json.load(f)
+total = 0
 
-print(f"Checkpoint: {len(checkpoint['examples'])} examples")
-print(f"Full: {len(full['examples'])} examples")
+# Stream both inputs back-to-back into the output, one example per line
+# (same layout as dataCollector.ts), without building the merged list.
+with open('trainingData_merged.json', 'wb', buffering=WRITE_BUFFER_SIZE) as out:
+    out.write(b'{"examples":[\n')
 
-merged = {
-    'examples': checkpoint['examples'] + full['examples'],
-    'metadata': {
-        'total_examples': len(checkpoint['examples']) + len(full['examples']),
-        'source': 'merged from checkpoint and full'
-    }
-}
+    for source in SOURCES:
+        print(f"Streaming {source}...")
+        count = 0
+        with open(source, 'rb') as f:
+            for example in ijson.items(f, 'examples.item', use_float=True):
+                if total:
+                    out.write(b',\n')
+                out.write(orjson.dumps(example))
+                count += 1
+                total += 1
+        print(f"{source}: {count} examples")
 
-print(f"Writing merged file with {len(merged['examples'])} examples...")
-with open('trainingData_merged.json', 'w') as f:
-    json.dump(merged, f)
+    out.write(b'\n],"metadata":')
+    out.write(orjson.dumps({
+        'total_examples': total,
+        'source': 'merged from checkpoint and full'
+    }))
+    out.write(b'}')
 
-print(f"✅ Merged {len(merged['examples'])} examples into trainingData_merged.json")
+print(f"✅ Merged {total} examples into trainingData_merged.json")
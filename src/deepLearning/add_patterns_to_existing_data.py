@@ -3,9 +3,19 @@ Add candlestick pattern features to existing training data
 Uses EXACT same logic as dataCollector.ts detectCandlestickPatterns()
 """
 
-import json
+import itertools
+import os
+import shutil
+import ijson
+import orjson
 import numpy as np
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+try:
+    from patterns_numba import detect_candlestick_patterns_numba
+except ImportError:  # Numba not installed: fall back to the NumPy kernel
+    detect_candlestick_patterns_numba = None
 
 def detect_candlestick_patterns(candles: List[Dict], context: Dict) -> Dict:
     """
@@ -113,10 +123,8 @@ def calculate_context_score(candles: List[Dict], token_context: Dict) -> float:
     # 2. Support/Resistance (price position in recent range)
     if len(candles) >= 20:
         recent_candles = candles[-20:]
-        highs = [c['high'] for c in recent_candles]
-        lows = [c['low'] for c in recent_candles]
-        recent_high = max(highs)
-        recent_low = min(lows)
+        recent_high = max(c['high'] for c in recent_candles)
+        recent_low = min(c['low'] for c in recent_candles)
         current_price = candles[-1]['close']
         
         if recent_high != recent_low:
@@ -139,42 +147,293 @@ def calculate_context_score(candles: List[Dict], token_context: Dict) -> float:
     return min(score, 1.0)  # Normalize to 0-1
 
 
-def process_training_data(input_file: str, output_file: str):
+PATTERNS_VERSION = 1  # Bump whenever the pattern logic changes so stored patterns get recomputed
+PATTERN_FLAGS = ('has_bullish_pin', 'has_bearish_pin', 'has_bullish_engulfing', 'has_bearish_engulfing')
+# Column order of the (N, 8) pattern matrix (same as preprocessor.py)
+PATTERN_FIELDS = PATTERN_FLAGS + ('wick_rejection_ratio', 'body_to_range_ratio', 'pattern_confidence', 'context_score')
+CANDLE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+MIN_WICK_TO_BODY_RATIO = 2.0
+BATCH_SIZE = 10000  # Examples per vectorized batch
+MIN_CHUNK_SIZE = 1000  # Smallest per-thread slice for the NumPy fallback
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024  # Output file buffer: fewer write syscalls for large datasets
+
+
+def candles_to_array(examples: List[Dict]) -> Optional[np.ndarray]:
     """
-    Add pattern features to existing training data
+    Stack the candles of a batch into an (N, T, 5) OHLCV array
+    Returns None if the windows have different lengths (or fewer than 2 candles)
+    """
+    lengths = {len(example['candles']) for example in examples}
+    if len(lengths) != 1 or lengths.pop() < 2:
+        return None
+    
+    # float64 so threshold comparisons match the TS port exactly
+    return np.array(
+        [[[c[field] for field in CANDLE_FIELDS] for c in example['candles']] for example in examples],
+        dtype=np.float64
+    )
+
+
+def calculate_context_score_batch(candles: np.ndarray, liquidity: np.ndarray) -> np.ndarray:
+    """
+    Vectorized calculate_context_score() over an (N, T, 5) OHLCV array
+    Each example is an independent window, so the last-20 max/min/first/last
+    are plain reductions over an (N, 20) view
+    """
+    score = np.zeros(candles.shape[0])
+    
+    if candles.shape[1] >= 20:
+        recent = candles[:, -20:]
+        
+        # 1. Trend analysis (price momentum over last 20 candles)
+        first_price = recent[:, 0, 3]
+        last_price = recent[:, -1, 3]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            price_change = ((last_price - first_price) / first_price) * 100
+        score += np.select(
+            [price_change > 10, price_change > 0, price_change < -10],
+            [0.30, 0.15, 0.10],
+            0.0
+        )
+        
+        # 2. Support/Resistance (price position in recent range)
+        recent_high = recent[:, :, 1].max(axis=1)
+        recent_low = recent[:, :, 2].min(axis=1)
+        recent_span = recent_high - recent_low
+        has_span = recent_span != 0
+        price_position = np.divide(last_price - recent_low, recent_span, out=np.zeros_like(score), where=has_span)
+        score += np.select(
+            [has_span & (price_position < 0.20), has_span & (price_position > 0.90)],
+            [0.25, 0.20],
+            0.0
+        )
+    
+    # 3. Liquidity context
+    score += np.select([liquidity > 500000, liquidity > 100000], [0.20, 0.10], 0.0)
+    
+    return np.minimum(score, 1.0)
+
+
+def detect_candlestick_patterns_batch(candles: np.ndarray, liquidity: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Vectorized detect_candlestick_patterns() over an (N, T, 5) OHLCV array
+    and (N,) liquidity vector. Returns one array per pattern field
     """
-    print(f"📂 Loading existing training data from {input_file}...")
+    last_open, last_high, last_low, last_close = (candles[:, -1, i] for i in range(4))
+    prev_body = np.abs(candles[:, -2, 3] - candles[:, -2, 0])
     
-    with open(input_file, 'r') as f:
-        data = json.load(f)
+    # Calculate candle metrics
+    body = np.abs(last_close - last_open)
+    upper_wick = last_high - np.maximum(last_close, last_open)
+    lower_wick = np.minimum(last_close, last_open) - last_low
+    total_range = last_high - last_low
+    
+    is_bullish = last_close > last_open
+    is_bearish = last_close < last_open
+    
+    has_range = total_range > 0
+    has_body = body > 0
+    zeros = np.zeros_like(body)
+    
+    body_to_range = np.divide(body, total_range, out=zeros.copy(), where=has_range)
+    wick_rejection_ratio = np.divide(np.maximum(upper_wick, lower_wick), body, out=zeros.copy(), where=has_body)
+    bullish_wick_strength = np.divide(lower_wick, total_range, out=zeros.copy(), where=has_range) * 100
+    bearish_wick_strength = np.divide(upper_wick, total_range, out=zeros.copy(), where=has_range) * 100
+    
+    # Pattern detection (same rules as the scalar version)
+    has_bullish_pin = (lower_wick > body * MIN_WICK_TO_BODY_RATIO) & is_bullish
+    has_bearish_pin = (upper_wick > body * MIN_WICK_TO_BODY_RATIO) & is_bearish
+    
+    engulfs_previous = body > prev_body * 0.6
+    strong_body = body_to_range > 0.6
+    has_bullish_engulfing = is_bullish & engulfs_previous & strong_body
+    has_bearish_engulfing = is_bearish & engulfs_previous & strong_body
+    
+    # Branchless confidence: each candidate is zeroed where its pattern is absent
+    # (all candidates are >= 0, so the max matches the scalar if-chain)
+    bullish_pin_confidence = np.minimum(60 + bullish_wick_strength * 0.3, 80) / 100
+    bearish_pin_confidence = np.minimum(60 + bearish_wick_strength * 0.3, 80) / 100
+    pattern_confidence = np.maximum.reduce([
+        bullish_pin_confidence * has_bullish_pin,
+        bearish_pin_confidence * has_bearish_pin,
+        0.65 * has_bullish_engulfing,
+        0.65 * has_bearish_engulfing,
+    ])
     
-    examples = data.get('examples', data)
-    print(f"✅ Loaded {len(examples):,} examples")
+    return {
+        'has_bullish_pin': has_bullish_pin,
+        'has_bearish_pin': has_bearish_pin,
+        'has_bullish_engulfing': has_bullish_engulfing,
+        'has_bearish_engulfing': has_bearish_engulfing,
+        'wick_rejection_ratio': np.minimum(wick_rejection_ratio, 10),  # Cap at 10 for stability
+        'body_to_range_ratio': body_to_range,
+        'pattern_confidence': pattern_confidence,
+        'context_score': calculate_context_score_batch(candles, liquidity),
+    }
+
+
+def detect_patterns_arrays(candles: np.ndarray, liquidity: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Pattern arrays for (N, T, 5) candles, using the Numba kernel when available
+    """
+    if detect_candlestick_patterns_numba is not None:
+        return detect_candlestick_patterns_numba(candles, liquidity)  # prange already uses every core
+    
+    # NumPy releases the GIL inside its kernels, so threads scale without pickling the arrays
+    n_chunks = min(os.cpu_count() or 1, len(candles) // MIN_CHUNK_SIZE)
+    if n_chunks <= 1:
+        return detect_candlestick_patterns_batch(candles, liquidity)
+    
+    bounds = np.linspace(0, len(candles), n_chunks + 1, dtype=int)
+    with ThreadPoolExecutor(max_workers=n_chunks) as pool:
+        parts = list(pool.map(
+            lambda i: detect_candlestick_patterns_batch(candles[bounds[i]:bounds[i + 1]], liquidity[bounds[i]:bounds[i + 1]]),
+            range(n_chunks)
+        ))
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def patterns_for_batch(examples: List[Dict]) -> List[Dict]:
+    """
+    Pattern dicts for a batch of examples (vectorized when windows line up)
+    """
+    candles = candles_to_array(examples)
+    if candles is None:
+        return [detect_candlestick_patterns(ex['candles'], ex['context']) for ex in examples]
     
-    # Check if already has patterns
-    if examples and 'patterns' in examples[0]:
-        print("⚠️ WARNING: Data already has pattern features!")
-        response = input("Do you want to recalculate patterns? (yes/no): ")
-        if response.lower() != 'yes':
-            print("❌ Aborted")
-            return
+    liquidity = np.array([ex['context'].get('liquidity', 0) for ex in examples], dtype=np.float64)
+    arrays = detect_patterns_arrays(candles, liquidity)
     
-    print("🔄 Calculating candlestick patterns...")
+    return [dict(zip(arrays, row)) for row in zip(*(values.tolist() for values in arrays.values()))]
+
+
+def _examples_prefix(f: BinaryIO) -> str:
+    """
+    ijson prefix of the examples array: {"examples": [...]} or a bare list
+    """
+    head = f.read(64).lstrip()
+    f.seek(0)
+    return 'item' if head.startswith(b'[') else 'examples.item'
+
+
+def iter_examples(input_file: str) -> Iterator[Dict]:
+    """
+    Stream examples one at a time without loading the whole file
+    """
+    with open(input_file, 'rb') as f:
+        yield from ijson.items(f, _examples_prefix(f), use_float=True)
+
+
+METADATA_MARKER = b'],"metadata":'  # Every writer puts metadata right after the examples array
+METADATA_TAIL_MAX = 64 * 1024 * 1024  # Give up looking for metadata past this many trailing bytes
+
+
+def load_metadata(input_file: str) -> Optional[Dict]:
+    """
+    Top-level metadata (if any), read from the tail of the file
+    
+    dataCollector.ts, merge_data.py and process_training_data() all write it last,
+    so the examples array never has to be parsed to reach it
+    """
+    with open(input_file, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        tail_size = 64 * 1024
+        while True:
+            start = max(size - tail_size, 0)
+            f.seek(start)
+            tail = f.read()
+            pos = tail.rfind(METADATA_MARKER)
+            if pos >= 0:
+                try:
+                    # Drop the closing brace of the top-level object
+                    return orjson.loads(tail[pos + len(METADATA_MARKER):].rstrip()[:-1])
+                except orjson.JSONDecodeError:
+                    return None
+            if start == 0 or tail_size >= METADATA_TAIL_MAX:
+                return None
+            tail_size *= 4
+
+
+def process_training_data(input_file: str, output_file: str):
+    """
+    Add pattern features to existing training data
+    
+    Examples are streamed from input_file and written to output_file one by one,
+    so memory stays flat regardless of dataset size. Only examples without
+    patterns of the current PATTERNS_VERSION are recalculated; a file already
+    stamped with the current version is copied to output_file as is.
+    """
+    print(f"📂 Streaming existing training data from {input_file}...")
+    
+    metadata = load_metadata(input_file)
+    if metadata is not None and metadata.get('patterns_version') == PATTERNS_VERSION:
+        print(f"✅ Patterns already up to date (version {PATTERNS_VERSION})")
+        if os.path.abspath(input_file) != os.path.abspath(output_file):
+            shutil.copyfile(input_file, output_file)
+            print(f"💾 Copied {input_file} to {output_file}")
+        return
+    
+    examples = iter_examples(input_file)
+    first = next(examples, None)
+    if first is None:
+        print("❌ No examples found")
+        return
+    
+    print(f"🔄 Calculating candlestick patterns (writing to {output_file})...")
     processed = 0
+    calculated = 0
+    sample = None
+    bullish_pins = bearish_pins = bullish_engulfing = bearish_engulfing = 0
     
-    for i, example in enumerate(examples):
-        # Calculate patterns from existing candles
-        patterns = detect_candlestick_patterns(example['candles'], example['context'])
-        example['patterns'] = patterns
+    with open(output_file, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        # Same layout as dataCollector.ts: one example per line
+        f.write(b'{"examples":[\n')
+        
+        examples = itertools.chain([first], examples)
+        while True:
+            batch = list(itertools.islice(examples, BATCH_SIZE))
+            if not batch:
+                break
+            
+            # Calculate patterns from existing candles (stale or missing only)
+            todo = [ex for ex in batch if ex.get('patterns', {}).get('version') != PATTERNS_VERSION]
+            if todo:
+                for example, patterns in zip(todo, patterns_for_batch(todo)):
+                    patterns['version'] = PATTERNS_VERSION
+                    example['patterns'] = patterns
+                calculated += len(todo)
+            
+            for example in batch:
+                patterns = example['patterns']
+                
+                if processed:
+                    f.write(b',\n')
+                f.write(orjson.dumps(example))
+                
+                if sample is None:
+                    sample = patterns
+                
+                # Pattern occurrences, counted in the same pass
+                bullish_pins += patterns['has_bullish_pin']
+                bearish_pins += patterns['has_bearish_pin']
+                bullish_engulfing += patterns['has_bullish_engulfing']
+                bearish_engulfing += patterns['has_bearish_engulfing']
+                
+                processed += 1
+            
+            print(f"  Processed {processed:,} examples ({calculated:,} recalculated)")
         
-        processed += 1
-        if processed % 1000 == 0:
-            print(f"  Processed {processed:,}/{len(examples):,} examples ({processed/len(examples)*100:.1f}%)")
+        f.write(b'\n]')
+        
+        # Preserve metadata and record which pattern logic produced the file
+        metadata = dict(metadata or {}, patterns_version=PATTERNS_VERSION)
+        f.write(b',"metadata":')
+        f.write(orjson.dumps(metadata))
+        f.write(b'}')
     
-    print(f"✅ Processed all {processed:,} examples")
+    print(f"✅ Processed all {processed:,} examples ({calculated:,} recalculated)")
     
     # Verify patterns were added
-    sample = examples[0]['patterns']
     print(f"\n📊 Sample pattern from first example:")
     print(f"  Bullish pin: {sample['has_bullish_pin']}")
     print(f"  Bearish pin: {sample['has_bearish_pin']}")
@@ -183,43 +442,66 @@ def process_training_data(input_file: str, output_file: str):
     print(f"  Pattern confidence: {sample['pattern_confidence']:.2f}")
     print(f"  Context score: {sample['context_score']:.2f}")
     
-    # Count pattern occurrences
-    bullish_pins = sum(1 for ex in examples if ex['patterns']['has_bullish_pin'])
-    bearish_pins = sum(1 for ex in examples if ex['patterns']['has_bearish_pin'])
-    bullish_engulfing = sum(1 for ex in examples if ex['patterns']['has_bullish_engulfing'])
-    bearish_engulfing = sum(1 for ex in examples if ex['patterns']['has_bearish_engulfing'])
-    
     print(f"\n📈 Pattern statistics:")
-    print(f"  Bullish pin bars: {bullish_pins:,} ({bullish_pins/len(examples)*100:.1f}%)")
-    print(f"  Bearish pin bars: {bearish_pins:,} ({bearish_pins/len(examples)*100:.1f}%)")
-    print(f"  Bullish engulfing: {bullish_engulfing:,} ({bullish_engulfing/len(examples)*100:.1f}%)")
-    print(f"  Bearish engulfing: {bearish_engulfing:,} ({bearish_engulfing/len(examples)*100:.1f}%)")
-    
-    # Save updated data
-    print(f"\n💾 Saving to {output_file}...")
-    
-    # Preserve metadata if it exists
-    if 'metadata' in data:
-        output_data = {
-            'examples': examples,
-            'metadata': data['metadata']
-        }
-    else:
-        output_data = {'examples': examples}
-    
-    with open(output_file, 'w') as f:
-        json.dump(output_data, f)
+    print(f"  Bullish pin bars: {bullish_pins:,} ({bullish_pins/processed*100:.1f}%)")
+    print(f"  Bearish pin bars: {bearish_pins:,} ({bearish_pins/processed*100:.1f}%)")
+    print(f"  Bullish engulfing: {bullish_engulfing:,} ({bullish_engulfing/processed*100:.1f}%)")
+    print(f"  Bearish engulfing: {bearish_engulfing:,} ({bearish_engulfing/processed*100:.1f}%)")
     
-    print(f"✅ Saved {len(examples):,} examples with pattern features!")
+    print(f"\n💾 Saved {processed:,} examples with pattern features to {output_file}!")
     print("\n🎯 Next steps:")
     print("  1. Run: python preprocessor.py")
     print("  2. Verify patterns are not all zeros")
     print("  3. Run: python model_pytorch.py")
 
 
+def process_npz_data(input_file: str, output_file: str):
+    """
+    Add pattern features to columnar training data (see migrate_to_npz.py)
+    
+    One vectorized call over the candles array; rows already computed with the
+    current PATTERNS_VERSION (the first `patterns_rows`) are kept, so appended
+    examples are the only ones recalculated. Everything else is written back unchanged.
+    """
+    print(f"📂 Loading columnar training data from {input_file}...")
+    with np.load(input_file) as data:
+        arrays = dict(data)
+    
+    candles = arrays['candles']
+    done = 0
+    if 'patterns_version' in arrays and int(arrays['patterns_version']) == PATTERNS_VERSION:
+        done = int(arrays['patterns_rows'])
+    if done >= len(candles):
+        print(f"✅ Patterns already up to date (version {PATTERNS_VERSION}), nothing to do")
+        return
+    
+    print(f"🔄 Calculating candlestick patterns for {len(candles) - done:,} of {len(candles):,} examples...")
+    # float64 so threshold comparisons match the TS port exactly
+    patterns = detect_patterns_arrays(candles[done:].astype(np.float64), arrays['context'][done:, 0].astype(np.float64))
+    arrays['patterns'][done:] = np.column_stack([patterns[field] for field in PATTERN_FIELDS])
+    arrays['patterns_version'] = np.array(PATTERNS_VERSION)
+    arrays['patterns_rows'] = np.array(len(candles))
+    
+    np.savez_compressed(output_file, **arrays)
+    
+    print(f"\n📈 Pattern statistics:")
+    for i, flag in enumerate(PATTERN_FLAGS):
+        count = int(arrays['patterns'][:, i].sum())
+        print(f"  {flag}: {count:,} ({count/len(candles)*100:.1f}%)")
+    
+    print(f"\n💾 Saved {len(candles):,} examples with pattern features to {output_file}!")
+
+
 if __name__ == '__main__':
     import sys
     
+    # Usage: python add_patterns_to_existing_data.py [--npz]
+    # --npz updates the columnar file from migrate_to_npz.py in place; preprocessor.py
+    # only reads the JSON files, so the JSON path stays the default
+    if '--npz' in sys.argv[1:]:
+        process_npz_data('../../trainingData.npz', '../../trainingData.npz')
+        sys.exit(0)
+    
     # Use checkpoint file (most recent data)
     input_file = '../../trainingData_checkpoint.json'
     output_file = '../../trainingData_with_patterns.json'
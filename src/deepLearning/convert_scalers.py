@@ -7,6 +7,7 @@ import pickle
 import json
 import numpy as np
 import os
+from preprocessor import load_processed_data, load_split
 
 
 def convert_scalers(input_path='../../scalers.pkl', output_path='../../scalers.json'):
@@ -43,13 +44,15 @@ def convert_scalers(input_path='../../scalers.pkl', output_path='../../scalers.j
         # Candle scaler (RobustScaler)
         if 'candle_scaler' in scalers:
             candle_scaler = scalers['candle_scaler']
+            # Plain {center_, scale_, n_features_in_} dict (current preprocessor) or a pickled sklearn RobustScaler
+            candle_params = candle_scaler if isinstance(candle_scaler, dict) else vars(candle_scaler)
             scaler_json['candle_scaler'] = {
                 'type': 'RobustScaler',
-                'center_': candle_scaler.center_.tolist(),
-                'scale_': candle_scaler.scale_.tolist(),
-                'n_features_in_': int(candle_scaler.n_features_in_)
+                'center_': np.asarray(candle_params['center_']).tolist(),
+                'scale_': np.asarray(candle_params['scale_']).tolist(),
+                'n_features_in_': int(candle_params['n_features_in_'])
             }
-            print(f"  ✅ Candle scaler: {candle_scaler.n_features_in_} features")
+            print(f"  ✅ Candle scaler: {candle_params['n_features_in_']} features")
         
         # Context scaler (StandardScaler)
         if 'context_scaler' in scalers:
@@ -134,7 +137,7 @@ def convert_scalers(input_path='../../scalers.pkl', output_path='../../scalers.j
         return False
 
 
-def verify_scalers(json_path='../../scalers.json', test_data_path='../../processed_data.npz'):
+def verify_scalers(json_path='../../scalers.json', test_data_path=None):
     """
     Verify that JSON scalers produce same results as pickle scalers
     """
@@ -148,10 +151,11 @@ def verify_scalers(json_path='../../scalers.json', test_data_path='../../process
             json_scalers = json.load(f)
         
         # Load test data
-        data = np.load(test_data_path)
-        test_candles = data['X_test_candles'][:5]  # First 5 samples
-        test_context = data['X_test_context'][:5]
-        test_indicators = data['X_test_indicators'][:5]
+        data = load_processed_data(test_data_path)
+        test_candles, test_combined, _ = load_split(data, 'test')
+        test_candles = test_candles[:5]  # First 5 samples
+        test_context = test_combined[:5, :5]  # combined = context (5) + indicators (5) + patterns (8)
+        test_indicators = test_combined[:5, 5:10]
         
         print(f"\n📊 Testing with {len(test_candles)} samples...")
         
@@ -3,18 +3,17 @@
 
 import torch
 import numpy as np
-from model_pytorch import SnipeBTModel, TradingDataset, evaluate_model, export_for_inference
+from preprocessor import load_processed_data, load_split
+from model_pytorch import SnipeBTModel, TradingDataset, DeviceDataLoader, evaluate_model, export_for_inference, export_onnx
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
 print("📂 Loading test data...")
-data = np.load('../../processed_data.npz')
-X_test_candles = data['X_test_candles']
-X_test_combined = data['X_test_combined']
-y_test = data['y_test']
+data = load_processed_data()
+X_test_candles, X_test_combined, y_test = load_split(data, 'test')
 
-test_dataset = TradingDataset(X_test_candles, X_test_combined, y_test)
-test_loader = torch.utils.data.DataLoader(test_dataset, batch_size=64, shuffle=False)
+test_dataset = TradingDataset(X_test_candles, X_test_combined, y_test, device=device)
+test_loader = DeviceDataLoader(test_dataset, batch_size=64, shuffle=False)
 
 print("📥 Loading best model...")
 model = SnipeBTModel().to(device)
@@ -27,5 +26,6 @@ evaluate_model(model, test_loader, device)
 
 # Export for inference
 export_for_inference(model)
+export_onnx(model)
 
 print("\n✅ Evaluation and export complete!")
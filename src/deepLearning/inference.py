@@ -13,9 +13,15 @@ if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8', errors='replace')
     sys.stderr.reconfigure(encoding='utf-8', errors='replace')
 
-import json
+import orjson
+import queue
+import threading
 import torch
 import pickle
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
 import numpy as np
 from pathlib import Path
 
@@ -25,14 +31,30 @@ ROOT_DIR = Path(__file__).parent.parent.parent.resolve()
 # Import model architecture
 from model_pytorch import SnipeBTModel
 
+# Layout of the flat per-request feature buffer: candles | context | indicators | patterns
+CANDLES_END = 100 * 5
+CONTEXT_END = CANDLES_END + 5
+INDICATORS_END = CONTEXT_END + 5
+FEATURES_SIZE = INDICATORS_END + 8
+
+# Max requests drained from stdin and run through the model in one forward pass
+BATCH_SIZE = 32
+
 class InferenceServer:
-    def __init__(self, model_path=None, scalers_path=None):
+    def __init__(self, model_path=None, scalers_path=None, onnx_path=None):
         # Use absolute paths from ROOT_DIR
         if model_path is None:
             model_path = ROOT_DIR / 'best_model_pytorch.pth'
         if scalers_path is None:
-            scalers_path = ROOT_DIR / 'scalers.pkl'
+            # convert_scalers.py output, unless the pickle is newer
+            scalers_path = ROOT_DIR / 'scalers.json'
+            pickle_path = ROOT_DIR / 'scalers.pkl'
+            if not scalers_path.exists() or (pickle_path.exists() and pickle_path.stat().st_mtime > scalers_path.stat().st_mtime):
+                scalers_path = pickle_path
+        if onnx_path is None:
+            onnx_path = ROOT_DIR / 'snipebt.onnx'
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.autocast_dtype = None
         
         # Load model
         print(f"🔥 Loading model from {model_path}...", file=sys.stderr, flush=True)
@@ -43,17 +65,125 @@ class InferenceServer:
         print(f"✅ Model loaded (Epoch {checkpoint['epoch']}, Val AUC: {checkpoint['val_auc']:.4f})", 
               file=sys.stderr, flush=True)
         
+        # Prefer the exported ONNX graph when onnxruntime is installed
+        self.session = self._load_onnx_session(Path(onnx_path), Path(model_path))
+        if self.session is not None:
+            self.device = torch.device('cpu')  # ORT manages its own device, preprocess on CPU
+        else:
+            self._optimize_model()
+        
         # Load scalers
         print(f"📊 Loading scalers from {scalers_path}...", file=sys.stderr, flush=True)
-        with open(scalers_path, 'rb') as f:
-            self.scalers = pickle.load(f)
-        print(f"✅ Scalers loaded (candles, context, indicators, patterns)", file=sys.stderr, flush=True)
+        scalers = self._load_scaler_vectors(Path(scalers_path))
+        
+        # Keep only the scaler vectors, as tensors next to the model (inverse scale precomputed)
+        self.candle_center, self.candle_inv_scale = scalers['candle_scaler']
+        self.context_mean, self.context_inv_scale = scalers['context_scaler']
+        self.indicator_mean, self.indicator_inv_scale = scalers['indicator_scaler']
+        print(f"✅ Scalers loaded (candles, context, indicators)", file=sys.stderr, flush=True)
+        
+        # Persistent staging buffers, reused by every batch and sliced to its size
+        self._capacity = 0
+        self._ensure_capacity(BATCH_SIZE)
         
         print("🚀 Inference server ready!", file=sys.stderr, flush=True)
     
-    def preprocess(self, raw_input):
+    def _load_onnx_session(self, onnx_path, model_path):
+        """
+        ONNX Runtime session for the exported model, or None to use PyTorch
         """
-        Convert raw input to scaled tensors
+        if ort is None:
+            return None
+        
+        # The int8 copy only pays off on CPU
+        providers = [p for p in ('CUDAExecutionProvider', 'CPUExecutionProvider') if p in ort.get_available_providers()]
+        quantized_path = onnx_path.with_suffix('.int8.onnx')
+        if providers[0] == 'CPUExecutionProvider' and quantized_path.exists():
+            onnx_path = quantized_path
+        
+        # Skip exports older than the checkpoint
+        if not onnx_path.exists() or onnx_path.stat().st_mtime < model_path.stat().st_mtime:
+            return None
+        
+        session = ort.InferenceSession(str(onnx_path), providers=providers)
+        print(f"⚡ Using ONNX Runtime ({onnx_path.name}, {session.get_providers()[0]})", file=sys.stderr, flush=True)
+        return session
+    
+    def _forward(self, candles, combined):
+        if self.session is not None:
+            outputs = self.session.run(None, {'candles': candles.numpy(), 'combined': combined.numpy()})
+            return [torch.from_numpy(output) for output in outputs]
+        with self._autocast():
+            return self.model(candles, combined)
+    
+    def _optimize_model(self):
+        """
+        GPU: torch.compile + bf16/fp16 autocast. CPU: traced + frozen TorchScript in fp32
+        """
+        example = (torch.zeros(1, 100, 5, device=self.device), torch.zeros(1, 18, device=self.device))
+        eager_model = self.model
+        try:
+            if self.device.type == 'cuda':
+                self.autocast_dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+                if hasattr(torch, 'compile'):
+                    self.model = torch.compile(self.model, dynamic=True)
+            else:
+                with torch.no_grad():
+                    self.model = torch.jit.optimize_for_inference(torch.jit.trace(self.model, example))
+            
+            # Warm up so compilation happens before the first real request
+            with torch.no_grad(), self._autocast():
+                self.model(*example)
+            print(f"⚡ Inference model optimized ({self.autocast_dtype or torch.float32})", file=sys.stderr, flush=True)
+        except Exception as e:
+            print(f"⚠️  Model optimization failed, using eager fp32: {e}", file=sys.stderr, flush=True)
+            self.model = eager_model
+            self.autocast_dtype = None
+    
+    def _autocast(self):
+        return torch.autocast(device_type=self.device.type, dtype=self.autocast_dtype,
+                              enabled=self.autocast_dtype is not None)
+    
+    def _load_scaler_vectors(self, scalers_path):
+        """
+        {name: (center, 1 / scale)} tensors from scalers.json or scalers.pkl
+        """
+        if scalers_path.suffix == '.json':
+            with open(scalers_path, 'rb') as f:
+                raw = orjson.loads(f.read())
+            params = {name: (values.get('center_', values.get('mean_')), values['scale_']) for name, values in raw.items()}
+        else:
+            with open(scalers_path, 'rb') as f:
+                raw = pickle.load(f)
+            # Plain dicts (candle stats) or sklearn scalers; RobustScaler has center_, StandardScaler has mean_
+            raw = {name: scaler if isinstance(scaler, dict) else vars(scaler) for name, scaler in raw.items()}
+            params = {name: (values.get('center_', values.get('mean_')), values['scale_']) for name, values in raw.items()}
+        
+        vectors = {}
+        for name, (center, scale) in params.items():
+            center = np.asarray(center, dtype=np.float64)
+            inv_scale = 1.0 / np.asarray(scale, dtype=np.float64)
+            vectors[name] = (
+                torch.tensor(center.astype(np.float32), device=self.device),
+                torch.tensor(inv_scale.astype(np.float32), device=self.device)
+            )
+        return vectors
+    
+    def _ensure_capacity(self, batch_size):
+        """
+        Grow the pinned host buffer and its device twin to hold batch_size rows
+        """
+        if batch_size <= self._capacity:
+            return
+        pin = self.device.type == 'cuda'
+        self._host_buffer = torch.empty((batch_size, FEATURES_SIZE), dtype=torch.float32, pin_memory=pin)
+        self._host_rows = self._host_buffer.numpy()  # Shares memory with the host buffer
+        self._device_buffer = torch.empty((batch_size, FEATURES_SIZE), dtype=torch.float32, device=self.device) if pin else self._host_buffer
+        self._capacity = batch_size
+    
+    def _flatten(self, raw_input, out):
+        """
+        Validate one request and pack it into a flat (518,) row of the staging buffer
         
         Input format:
         {
@@ -81,66 +211,116 @@ class InferenceServer:
         if patterns.shape != (8,):
             raise ValueError(f"Expected patterns shape (8,), got {patterns.shape}")
         
-        # Scale features
-        candles_scaled = self.scalers['candle_scaler'].transform(candles)  # (100, 5)
-        context_scaled = self.scalers['context_scaler'].transform(context.reshape(1, -1))[0]  # (5,)
-        indicators_scaled = self.scalers['indicator_scaler'].transform(indicators.reshape(1, -1))[0]  # (5,)
-        patterns_scaled = patterns  # Patterns already normalized 0-1 or boolean
+        out[:CANDLES_END] = candles.ravel()
+        out[CANDLES_END:CONTEXT_END] = context
+        out[CONTEXT_END:INDICATORS_END] = indicators
+        out[INDICATORS_END:FEATURES_SIZE] = patterns
+    
+    def preprocess(self, batch_size):
+        """
+        Convert the first batch_size staged rows to scaled tensors
+        """
+        # One host-to-device copy for the whole batch, into the persistent device buffer
+        buffer = self._device_buffer[:batch_size]
+        if buffer.data_ptr() != self._host_buffer.data_ptr():
+            buffer.copy_(self._host_buffer[:batch_size], non_blocking=True)
         
-        # Combine context + indicators + patterns
-        combined = np.concatenate([context_scaled, indicators_scaled, patterns_scaled])  # (18,)
+        # Scale features on the model's device
+        candles_scaled = (buffer[:, :CANDLES_END].view(batch_size, 100, 5) - self.candle_center) * self.candle_inv_scale  # (B, 100, 5)
+        context_scaled = (buffer[:, CANDLES_END:CONTEXT_END] - self.context_mean) * self.context_inv_scale  # (B, 5)
+        indicators_scaled = (buffer[:, CONTEXT_END:INDICATORS_END] - self.indicator_mean) * self.indicator_inv_scale  # (B, 5)
+        patterns_scaled = buffer[:, INDICATORS_END:FEATURES_SIZE]  # Patterns already normalized 0-1 or boolean
         
-        # Convert to tensors and add batch dimension
-        candles_tensor = torch.tensor(candles_scaled, dtype=torch.float32).unsqueeze(0).to(self.device)  # (1, 100, 5)
-        combined_tensor = torch.tensor(combined, dtype=torch.float32).unsqueeze(0).to(self.device)  # (1, 18)
+        # Combine context + indicators + patterns
+        combined = torch.cat([context_scaled, indicators_scaled, patterns_scaled], dim=1)  # (B, 18)
         
-        return candles_tensor, combined_tensor
+        return candles_scaled, combined
     
-    def predict(self, raw_input):
+    def _error_result(self, message):
+        return {
+            "error": message,
+            "profitable": 0.0,
+            "max_profit": 0.0,
+            "rug_risk": 1.0,
+            "confidence": 0.0
+        }
+    
+    def predict_batch(self, raw_inputs):
         """
-        Run inference and return predictions
+        Run inference on a list of requests in one forward pass
         
-        Returns:
+        Returns one result per request, in input order:
         {
             "profitable": 0.78,        // Probability 0-1
             "max_profit": 4.2,         // Expected max profit %
             "rug_risk": 0.05,          // Probability 0-1
             "confidence": 0.85         // Overall confidence 0-1
         }
+        Invalid requests get an error result without failing the rest of the batch
         """
+        self._ensure_capacity(len(raw_inputs))
+        results = [None] * len(raw_inputs)
+        valid_indices = []
+        for i, raw_input in enumerate(raw_inputs):
+            try:
+                # A failed request leaves its row to be overwritten by the next valid one
+                self._flatten(raw_input, self._host_rows[len(valid_indices)])
+                valid_indices.append(i)
+            except Exception as e:
+                results[i] = self._error_result(str(e))
+        
+        if not valid_indices:
+            return results
+        
         try:
             # Preprocess
-            candles, combined = self.preprocess(raw_input)
+            candles, combined = self.preprocess(len(valid_indices))
             
             # Inference
             with torch.no_grad():
-                profitable_logit, max_profit_pred, rug_logit = self.model(candles, combined)
+                profitable_logit, max_profit_pred, rug_logit = self._forward(candles, combined)
                 
                 # Convert to probabilities
-                profitable_prob = torch.sigmoid(profitable_logit).item()
-                rug_prob = torch.sigmoid(rug_logit).item()
-                max_profit_value = max_profit_pred.item()
+                profitable_prob = torch.sigmoid(profitable_logit.float()).view(-1)
+                rug_prob = torch.sigmoid(rug_logit.float()).view(-1)
+                max_profit_value = max_profit_pred.float().view(-1)
                 
                 # Calculate confidence (distance from 0.5 decision boundary)
-                profitable_confidence = abs(profitable_prob - 0.5) * 2  # 0-1 scale
-                rug_confidence = abs(rug_prob - 0.5) * 2
+                profitable_confidence = (profitable_prob - 0.5).abs() * 2  # 0-1 scale
+                rug_confidence = (rug_prob - 0.5).abs() * 2
                 overall_confidence = (profitable_confidence + rug_confidence) / 2
                 
-                return {
-                    "profitable": float(profitable_prob),
-                    "max_profit": float(max_profit_value),
-                    "rug_risk": float(rug_prob),
-                    "confidence": float(overall_confidence)
+                outputs = torch.stack([profitable_prob, max_profit_value, rug_prob, overall_confidence], dim=1).cpu().tolist()
+            
+            for i, (profitable, max_profit, rug_risk, confidence) in zip(valid_indices, outputs):
+                results[i] = {
+                    "profitable": profitable,
+                    "max_profit": max_profit,
+                    "rug_risk": rug_risk,
+                    "confidence": confidence
                 }
         
         except Exception as e:
-            return {
-                "error": str(e),
-                "profitable": 0.0,
-                "max_profit": 0.0,
-                "rug_risk": 1.0,
-                "confidence": 0.0
-            }
+            for i in valid_indices:
+                results[i] = self._error_result(str(e))
+        
+        return results
+    
+    def predict(self, raw_input):
+        """
+        Run inference on a single request
+        """
+        return self.predict_batch([raw_input])[0]
+    
+    def _read_stdin(self, requests):
+        """
+        Background reader: push stdin lines onto the queue, None on EOF
+        """
+        for line in sys.stdin:
+            line = line.strip()
+            if line:
+                requests.put(line)
+        requests.put(None)
     
     def run(self):
         """
@@ -148,41 +328,49 @@ class InferenceServer:
         """
         print("🎯 Listening for inference requests...", file=sys.stderr, flush=True)
         
-        for line in sys.stdin:
-            line = line.strip()
-            if not line:
+        out = sys.stdout.buffer
+        requests = queue.Queue()
+        threading.Thread(target=self._read_stdin, args=(requests,), daemon=True).start()
+        
+        done = False
+        while not done:
+            # Block for the first request, then drain whatever else is already queued
+            lines = [requests.get()]
+            while len(lines) < BATCH_SIZE:
+                try:
+                    lines.append(requests.get_nowait())
+                except queue.Empty:
+                    break
+            if None in lines:
+                done = True
+                lines = lines[:lines.index(None)]
+            if not lines:
                 continue
             
-            try:
-                # Parse input
-                request = json.loads(line)
-                
-                # Run prediction
-                result = self.predict(request)
-                
-                # Write result to stdout (TypeScript reads this)
-                print(json.dumps(result), flush=True)
-            
-            except json.JSONDecodeError as e:
-                error_result = {
-                    "error": f"Invalid JSON: {e}",
-                    "profitable": 0.0,
-                    "max_profit": 0.0,
-                    "rug_risk": 1.0,
-                    "confidence": 0.0
-                }
-                print(json.dumps(error_result), flush=True)
+            # Parse input (bad lines keep their slot so responses stay in order)
+            results = [None] * len(lines)
+            batch_indices = []
+            batch = []
+            for i, line in enumerate(lines):
+                try:
+                    batch.append(orjson.loads(line))
+                    batch_indices.append(i)
+                except orjson.JSONDecodeError as e:
+                    results[i] = self._error_result(f"Invalid JSON: {e}")
             
+            # Run prediction
+            try:
+                for i, result in zip(batch_indices, self.predict_batch(batch)):
+                    results[i] = result
             except Exception as e:
-                error_result = {
-                    "error": f"Inference failed: {e}",
-                    "profitable": 0.0,
-                    "max_profit": 0.0,
-                    "rug_risk": 1.0,
-                    "confidence": 0.0
-                }
-                print(json.dumps(error_result), flush=True)
-
+                for i in batch_indices:
+                    results[i] = self._error_result(f"Inference failed: {e}")
+            
+            # Write results to stdout in request order (TypeScript reads this), one flush per batch
+            for result in results:
+                out.write(orjson.dumps(result))
+                out.write(b'\n')
+            out.flush()
 
 if __name__ == '__main__':
     server = InferenceServer()
@@ -34,8 +34,12 @@ interface PredictionResult {
     confidence: number;               // Overall confidence 0-1
 }
 
+// serving_default signature keys (Keras input/output layer names in model.py)
+const INPUT_KEYS = ['candles_input', 'ctx_input'];
+const OUTPUT_KEY = 'heads';  // (1, 3): profitable, max_profit, rug_risk
+
 export class DeepLearningInference {
-    private model: tf.LayersModel | null = null;
+    private model: tf.GraphModel | null = null;
     private scalers: any = null;
     private modelPath: string;
     private scalersPath: string;
@@ -56,8 +60,8 @@ export class DeepLearningInference {
         try {
             console.log('🧠 Loading deep learning model...');
             
-            // Load TensorFlow.js model
-            this.model = await tf.loadLayersModel(`file://${this.modelPath}`);
+            // Load TensorFlow.js graph model (converted from SavedModel)
+            this.model = await tf.loadGraphModel(`file://${this.modelPath}`);
             console.log(`✅ Model loaded from ${this.modelPath}`);
             
             // Load scalers (converted from Python pickle to JSON)
@@ -145,41 +149,39 @@ export class DeepLearningInference {
             
             // Prepare inputs
             const candlesTensor = this.prepareCandleInput(recentCandles);
-            const contextTensor = this.prepareContextInput(context);
-            const indicatorsTensor = this.prepareIndicatorInput(indicators);
+            const ctxTensor = this.prepareCtxInput(context, indicators);
             
-            // Run inference
+            // Run inference (LSTM while-loops need async execution in a graph model)
             const start = Date.now();
-            const predictions = this.model.predict([
-                candlesTensor,
-                contextTensor,
-                indicatorsTensor
-            ]) as tf.Tensor[];
+            const inputs: tf.NamedTensorMap = {};
+            [candlesTensor, ctxTensor].forEach((tensor, i) => {
+                inputs[this.signatureNode('inputs', INPUT_KEYS[i])] = tensor;
+            });
+            const predictions = await this.model.executeAsync(
+                inputs,
+                this.signatureNode('outputs', OUTPUT_KEY)
+            ) as tf.Tensor;
             
             const elapsed = Date.now() - start;
             
-            // Extract predictions
-            const [profitableProb, maxProfit, rugRisk] = await Promise.all([
-                predictions[0].data(),
-                predictions[1].data(),
-                predictions[2].data()
-            ]);
+            // Extract predictions (one read of the stacked heads)
+            const [profitableProb, maxProfit, rugRisk] = await predictions.data();
             
             // Cleanup tensors
-            tf.dispose([candlesTensor, contextTensor, indicatorsTensor, ...predictions]);
+            tf.dispose([candlesTensor, ctxTensor, predictions]);
             
             // Calculate overall confidence
             // High confidence if: profitable likely, good profit expected, low rug risk
             const confidence = this.calculateConfidence(
-                profitableProb[0],
-                maxProfit[0],
-                rugRisk[0]
+                profitableProb,
+                maxProfit,
+                rugRisk
             );
             
             const result: PredictionResult = {
-                profitable_probability: profitableProb[0],
-                max_profit_percent: maxProfit[0],
-                rug_risk_probability: rugRisk[0],
+                profitable_probability: profitableProb,
+                max_profit_percent: maxProfit,
+                rug_risk_probability: rugRisk,
                 confidence
             };
             
@@ -195,6 +197,14 @@ export class DeepLearningInference {
         }
     }
     
+    /**
+     * Graph node name for a serving_default signature key
+     */
+    private signatureNode(kind: 'inputs' | 'outputs', key: string): string {
+        const info = (this.model?.signature as any)?.[kind]?.[key];
+        return info?.name ?? key;
+    }
+    
     /**
      * Prepare candle data as tensor
      */
@@ -218,9 +228,9 @@ export class DeepLearningInference {
     }
     
     /**
-     * Prepare context data as tensor
+     * Prepare context + indicator data as one tensor (model's ctx_input)
      */
-    private prepareContextInput(context: ContextData): tf.Tensor {
+    private prepareCtxInput(context: ContextData, indicators: IndicatorData): tf.Tensor {
         const contextArray = [
             context.liquidity,
             context.marketCap,
@@ -229,19 +239,6 @@ export class DeepLearningInference {
             context.volume24h
         ];
         
-        // Scale using StandardScaler parameters
-        const scaled = this.scalers.context_scaler
-            ? this.scaleStandard(contextArray, this.scalers.context_scaler)
-            : contextArray;
-        
-        // Create tensor: shape (1, 5)
-        return tf.tensor2d([scaled], [1, 5]);
-    }
-    
-    /**
-     * Prepare indicator data as tensor
-     */
-    private prepareIndicatorInput(indicators: IndicatorData): tf.Tensor {
         const indicatorArray = [
             indicators.rsi,
             indicators.macd,
@@ -251,12 +248,15 @@ export class DeepLearningInference {
         ];
         
         // Scale using StandardScaler parameters
-        const scaled = this.scalers.indicator_scaler
+        const scaledContext = this.scalers.context_scaler
+            ? this.scaleStandard(contextArray, this.scalers.context_scaler)
+            : contextArray;
+        const scaledIndicators = this.scalers.indicator_scaler
             ? this.scaleStandard(indicatorArray, this.scalers.indicator_scaler)
             : indicatorArray;
         
-        // Create tensor: shape (1, 5)
-        return tf.tensor2d([scaled], [1, 5]);
+        // Create tensor: shape (1, 10)
+        return tf.tensor2d([[...scaledContext, ...scaledIndicators]], [1, 10]);
     }
     
     /**
@@ -0,0 +1,92 @@
+"""
+One-time migration of JSON training data to a columnar NPZ file
+Streams trainingData_*.json and writes fixed-shape arrays that load without parsing:
+    candles    (N, 100, 5) float32 - open, high, low, close, volume
+    context    (N, 5)      float32 - liquidity, marketCap, holders, age, volume24h
+    indicators (N, 5)      float32 - rsi, macd, ema_fast, ema_slow, bbands_width
+    patterns   (N, 8)      float32 - PATTERN_FIELDS order (zeros if missing)
+    labels     (N, 3)      float32 - profitable, max_profit, rug_risk
+"""
+
+import itertools
+import os
+import sys
+import numpy as np
+from typing import Dict, List
+
+from add_patterns_to_existing_data import BATCH_SIZE, CANDLE_FIELDS, PATTERN_FIELDS, iter_examples
+
+CONTEXT_FIELDS = ('liquidity', 'marketCap', 'holders', 'age', 'volume24h')
+INDICATOR_FIELDS = ('rsi', 'macd', 'ema_fast', 'ema_slow', 'bbands_width')
+LABEL_FIELDS = ('profitable', 'max_profit', 'rug_risk')
+
+
+def examples_to_arrays(examples: List[Dict]) -> Dict[str, np.ndarray]:
+    """
+    Column arrays for a batch of example dicts
+    """
+    candles = np.array(
+        [[[c[field] for field in CANDLE_FIELDS] for c in ex['candles']] for ex in examples],
+        dtype=np.float32
+    )
+    return {
+        'candles': candles,
+        'context': np.array([[ex['context'][field] for field in CONTEXT_FIELDS] for ex in examples], dtype=np.float32),
+        'indicators': np.array([[ex['indicators'][field] for field in INDICATOR_FIELDS] for ex in examples], dtype=np.float32),
+        'patterns': np.array(
+            [[ex['patterns'][field] for field in PATTERN_FIELDS] if 'patterns' in ex else [0.0] * len(PATTERN_FIELDS)
+             for ex in examples],
+            dtype=np.float32
+        ),
+        'labels': np.array([[ex['labels'][field] for field in LABEL_FIELDS] for ex in examples], dtype=np.float32),
+    }
+
+
+def migrate(input_files: List[str], output_file: str, append: bool = False):
+    """
+    Stream every example from input_files into one compressed NPZ file
+    With append=True the new rows go after the existing arrays in output_file,
+    keeping its patterns_version/patterns_rows so only new rows need patterns
+    """
+    chunks = []
+    extra = {}
+    if append and os.path.exists(output_file):
+        print(f"📂 Appending to {output_file}...")
+        with np.load(output_file) as data:
+            existing = dict(data)
+        extra = {key: existing.pop(key) for key in ('patterns_version', 'patterns_rows') if key in existing}
+        chunks.append(existing)
+    for input_file in input_files:
+        print(f"📂 Streaming {input_file}...")
+        examples = iter_examples(input_file)
+        while True:
+            batch = list(itertools.islice(examples, BATCH_SIZE))
+            if not batch:
+                break
+            chunks.append(examples_to_arrays(batch))
+            print(f"  Converted {sum(len(chunk['labels']) for chunk in chunks):,} examples")
+    
+    if not chunks:
+        print("❌ No examples found")
+        return
+    
+    arrays = {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+    np.savez_compressed(output_file, **arrays, **extra)
+    
+    print(f"\n📊 Array shapes:")
+    for key, values in arrays.items():
+        print(f"  {key}: {values.shape}")
+    print(f"\n💾 Saved {len(arrays['labels']):,} examples to {output_file}!")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("📦 Training Data JSON -> NPZ Migration")
+    print("=" * 60)
+    print()
+    
+    # Usage: python migrate_to_npz.py [--append] [input.json ...]
+    args = sys.argv[1:]
+    append = '--append' in args
+    input_files = [arg for arg in args if arg != '--append'] or ['../../trainingData_merged.json']
+    migrate(input_files, '../../trainingData.npz', append=append)
@@ -1,63 +1,148 @@
 """
-Deep Learning Model: Bidirectional LSTM + Custom Attention
+Deep Learning Model: Dilated Conv1D + Self-Attention (or Bidirectional LSTM) + Custom Attention
 Predicts profitable trades, max profit, and rug risk
 """
 
+import os
+
+# GPU runtime knobs are read when TensorFlow initialises, so set them before the import
+os.environ.setdefault('TF_CUDNN_USE_AUTOTUNE', '1')  # Benchmark cuDNN conv/RNN algorithms per shape, cache the fastest
+os.environ.setdefault('TF_GPU_THREAD_MODE', 'gpu_private')  # Dedicated threads launch GPU kernels
+os.environ.setdefault('TF_GPU_THREAD_COUNT', '2')
+
 import tensorflow as tf
 from tensorflow import keras
-from tensorflow.keras import layers, Model
+from tensorflow.keras import layers, Model, mixed_precision
 import numpy as np
 import json
 import tensorflowjs as tfjs
 from datetime import datetime
+from preprocessor import load_processed_data, load_split
+
+# Allocate VRAM as needed instead of grabbing all 6 GB up front (GPU is shared with the desktop)
+for gpu in tf.config.list_physical_devices('GPU'):
+    tf.config.experimental.set_memory_growth(gpu, True)
+
+# Mixed precision: fp16 compute with fp32 variables (fast FP16 math on the GTX 1660)
+# CPU has no fast fp16 path, so only enable it when a GPU is present
+if tf.config.list_physical_devices('GPU'):
+    mixed_precision.set_global_policy('mixed_float16')
 
 
 class AttentionLayer(layers.Layer):
     """
     Custom Attention mechanism for time-series
     Learns which candles are most important for prediction
+    
+    Scores each timestep with one scalar, tanh(x @ W1 + b) @ W2, and returns the
+    attention-weighted sum over time: (batch, timesteps, features) -> (batch, features)
     """
-    def __init__(self, **kwargs):
+    def __init__(self, attention_dim: int = 32, **kwargs):
         super(AttentionLayer, self).__init__(**kwargs)
+        self.attention_dim = attention_dim
     
     def build(self, input_shape):
-        self.W = self.add_weight(
+        self.W1 = self.add_weight(
             name='attention_weight',
-            shape=(input_shape[-1], input_shape[-1]),
+            shape=(input_shape[-1], self.attention_dim),
             initializer='glorot_uniform',
             trainable=True
         )
         self.b = self.add_weight(
             name='attention_bias',
-            shape=(input_shape[-1],),
+            shape=(self.attention_dim,),
             initializer='zeros',
             trainable=True
         )
+        self.W2 = self.add_weight(
+            name='attention_score',
+            shape=(self.attention_dim, 1),
+            initializer='glorot_uniform',
+            trainable=True
+        )
         super(AttentionLayer, self).build(input_shape)
     
     def call(self, inputs):
+        # Model-level jit_compile fuses matmul + bias + tanh + softmax + weighted sum
         # inputs shape: (batch_size, timesteps, features)
         
-        # Calculate attention scores
-        e = tf.tanh(tf.matmul(inputs, self.W) + self.b)  # (batch, timesteps, features)
-        a = tf.nn.softmax(e, axis=1)  # (batch, timesteps, features)
+        # Calculate one attention score per timestep
+        e = tf.tanh(tf.matmul(inputs, self.W1) + self.b)  # (batch, timesteps, attention_dim)
+        scores = tf.matmul(e, self.W2)  # (batch, timesteps, 1)
+        a = tf.nn.softmax(tf.cast(scores, tf.float32), axis=1)  # Softmax in fp32 under mixed precision
         
-        # Apply attention weights
-        output = inputs * a  # Element-wise multiplication
+        # Attention-weighted sum over timesteps
+        output = tf.reduce_sum(inputs * tf.cast(a, inputs.dtype), axis=1)  # (batch, features)
         
         return output
     
     def get_config(self):
-        return super(AttentionLayer, self).get_config()
+        config = super(AttentionLayer, self).get_config()
+        config.update({'attention_dim': self.attention_dim})
+        return config
+
 
+# Columns of the stacked 'heads' output / label array
+PROFITABLE, MAX_PROFIT, RUG_RISK = 0, 1, 2
 
-def create_model(input_shapes: dict, batch_size: int = 64) -> Model:
+
+@keras.saving.register_keras_serializable(package='SnipeBT')
+def combined_loss(y_true, y_pred):
+    """
+    Weighted multi-task loss on the stacked (profitable, max_profit, rug_risk) output
+    """
+    y_true = tf.cast(y_true, y_pred.dtype)
+    profitable = keras.losses.binary_crossentropy(y_true[:, PROFITABLE:PROFITABLE + 1], y_pred[:, PROFITABLE:PROFITABLE + 1])
+    max_profit = keras.losses.mean_squared_error(y_true[:, MAX_PROFIT:MAX_PROFIT + 1], y_pred[:, MAX_PROFIT:MAX_PROFIT + 1])
+    rug_risk = keras.losses.binary_crossentropy(y_true[:, RUG_RISK:RUG_RISK + 1], y_pred[:, RUG_RISK:RUG_RISK + 1])
+    return (
+        1.0 * profitable +  # Most important
+        0.5 * max_profit +  # Somewhat important
+        1.0 * rug_risk      # Very important (avoid rugs)
+    )
+
+
+class _HeadMetric:
+    """
+    Mixin: compute a metric on one column of the stacked output
+    """
+    def __init__(self, index: int, **kwargs):
+        super().__init__(**kwargs)
+        self.index = index
+    
+    def update_state(self, y_true, y_pred, sample_weight=None):
+        return super().update_state(y_true[:, self.index], y_pred[:, self.index], sample_weight)
+    
+    def get_config(self):
+        config = super().get_config()
+        config.update({'index': self.index})
+        return config
+
+
+@keras.saving.register_keras_serializable(package='SnipeBT')
+class HeadAccuracy(_HeadMetric, keras.metrics.BinaryAccuracy):
+    pass
+
+
+@keras.saving.register_keras_serializable(package='SnipeBT')
+class HeadAUC(_HeadMetric, keras.metrics.AUC):
+    pass
+
+
+@keras.saving.register_keras_serializable(package='SnipeBT')
+class HeadMAE(_HeadMetric, keras.metrics.MeanAbsoluteError):
+    pass
+
+
+def create_model(input_shapes: dict, batch_size: int = 192, encoder: str = 'conv') -> Model:
     """
     Create the deep learning model
     
     Args:
-        input_shapes: Dict with keys 'candles', 'context', 'indicators'
-        batch_size: Batch size for training (optimized for GTX 1660)
+        input_shapes: Dict with keys 'candles', 'ctx' (context + indicators, concatenated in the data)
+        batch_size: Batch size for training; the learning rate is scaled linearly from 1e-4 at 64
+        encoder: Candle encoder - 'conv' (dilated Conv1D + self-attention, parallel over time)
+                 or 'lstm' (BiLSTM followed by a unidirectional LSTM)
     
     Returns:
         Compiled Keras model
@@ -69,37 +154,46 @@ def create_model(input_shapes: dict, batch_size: int = 64) -> Model:
     # Candles: (100, 5) - OHLCV time-series
     candles_input = keras.Input(shape=input_shapes['candles'], name='candles_input')
     
-    # Context: (5,) - Liquidity, market cap, holders, age, volume
-    context_input = keras.Input(shape=input_shapes['context'], name='context_input')
-    
-    # Indicators: (5,) - RSI, MACD, EMAs, Bollinger width
-    indicators_input = keras.Input(shape=input_shapes['indicators'], name='indicators_input')
+    # Context + indicators: (10,) - liquidity, market cap, holders, age, volume,
+    # RSI, MACD, EMAs, Bollinger width (concatenated once in the data, not per step)
+    ctx_input = keras.Input(shape=input_shapes['ctx'], name='ctx_input')
     
-    # ===== CANDLE PROCESSING (LSTM + ATTENTION) =====
+    # ===== CANDLE PROCESSING (ENCODER + ATTENTION) =====
     
-    # Bidirectional LSTM for temporal patterns
-    x = layers.Bidirectional(
-        layers.LSTM(128, return_sequences=True, dropout=0.2, name='lstm_1')
-    )(candles_input)
-    
-    # Second LSTM layer
-    x = layers.Bidirectional(
-        layers.LSTM(64, return_sequences=True, dropout=0.2, name='lstm_2')
-    )(x)
+    if encoder == 'conv':
+        # Dilated causal convolutions: receptive field of 61 candles, no recurrent dependency
+        x = candles_input
+        for dilation in (1, 2, 4, 8):
+            x = layers.Conv1D(128, 5, padding='causal', dilation_rate=dilation, activation='relu',
+                              name=f'conv_d{dilation}')(x)
+        x = layers.Dropout(0.2, name='conv_dropout')(x)
+        
+        # Self-attention across all timesteps
+        attended = layers.MultiHeadAttention(num_heads=4, key_dim=32, name='self_attention')(x, x)
+        x = layers.LayerNormalization(name='self_attention_norm')(x + attended)
+    
+    elif encoder == 'lstm':
+        # Bidirectional LSTM for temporal patterns
+        # (no dropout= inside the LSTM: it disables the fused cuDNN kernel, so dropout is a separate layer)
+        x = layers.Bidirectional(
+            layers.LSTM(128, return_sequences=True, name='lstm_1')
+        )(candles_input)
+        x = layers.Dropout(0.2, name='lstm_1_dropout')(x)
+        
+        # Second LSTM layer (unidirectional: the first layer already sees both directions)
+        x = layers.LSTM(64, return_sequences=True, name='lstm_2')(x)
+        x = layers.Dropout(0.2, name='lstm_2_dropout')(x)
     
-    # Custom Attention layer
-    x = AttentionLayer(name='attention')(x)
+    else:
+        raise ValueError(f"Unknown encoder: {encoder} (expected 'conv' or 'lstm')")
     
-    # Global average pooling to get fixed-size output
-    candles_features = layers.GlobalAveragePooling1D(name='candles_pool')(x)
+    # Custom Attention layer (pools timesteps into a fixed-size output)
+    candles_features = AttentionLayer(name='attention')(x)
     
     # ===== CONTEXT & INDICATORS PROCESSING =====
     
-    # Combine context and indicators
-    combined = layers.Concatenate(name='combine_context_indicators')([context_input, indicators_input])
-    
     # Dense layers for context/indicators
-    context_features = layers.Dense(64, activation='relu', name='context_dense_1')(combined)
+    context_features = layers.Dense(64, activation='relu', name='context_dense_1')(ctx_input)
     context_features = layers.Dropout(0.3)(context_features)
     context_features = layers.Dense(32, activation='relu', name='context_dense_2')(context_features)
     
@@ -110,12 +204,16 @@ def create_model(input_shapes: dict, batch_size: int = 64) -> Model:
     # ===== FULLY CONNECTED LAYERS =====
     
     # Deep dense layers with batch normalization
-    x = layers.Dense(256, activation='relu', name='fc_1')(merged)
+    # Dense (no bias) -> BN -> ReLU so BN folds into the matmul and ReLU fuses at inference
+    # (no fused=True: Keras rejects it for 2-D inputs)
+    x = layers.Dense(256, use_bias=False, name='fc_1')(merged)
     x = layers.BatchNormalization(name='bn_1')(x)
+    x = layers.ReLU(name='relu_1')(x)
     x = layers.Dropout(0.4)(x)
     
-    x = layers.Dense(128, activation='relu', name='fc_2')(x)
+    x = layers.Dense(128, use_bias=False, name='fc_2')(x)
     x = layers.BatchNormalization(name='bn_2')(x)
+    x = layers.ReLU(name='relu_2')(x)
     x = layers.Dropout(0.3)(x)
     
     x = layers.Dense(64, activation='relu', name='fc_3')(x)
@@ -123,54 +221,81 @@ def create_model(input_shapes: dict, batch_size: int = 64) -> Model:
     
     # ===== OUTPUT LAYERS (MULTI-TASK) =====
     
+    # Output heads stay float32 for numerically stable sigmoid/loss under mixed precision
+    
     # Output 1: Profitable (binary classification)
-    profitable_output = layers.Dense(1, activation='sigmoid', name='profitable')(x)
+    profitable_output = layers.Dense(1, activation='sigmoid', dtype='float32', name='profitable')(x)
     
     # Output 2: Max Profit (regression)
-    max_profit_output = layers.Dense(1, activation='linear', name='max_profit')(x)
+    max_profit_output = layers.Dense(1, activation='linear', dtype='float32', name='max_profit')(x)
     
     # Output 3: Rug Risk (binary classification)
-    rug_risk_output = layers.Dense(1, activation='sigmoid', name='rug_risk')(x)
+    rug_risk_output = layers.Dense(1, activation='sigmoid', dtype='float32', name='rug_risk')(x)
+    
+    # Single stacked output: (batch, 3) = profitable, max_profit, rug_risk
+    heads = layers.Concatenate(dtype='float32', name='heads')([profitable_output, max_profit_output, rug_risk_output])
     
     # ===== CREATE MODEL =====
     
     model = Model(
-        inputs=[candles_input, context_input, indicators_input],
-        outputs=[profitable_output, max_profit_output, rug_risk_output],
+        inputs=[candles_input, ctx_input],
+        outputs=heads,
         name='SnipeBT_DeepLearning'
     )
     
     # ===== COMPILE MODEL =====
     
+    optimizer = keras.optimizers.Adam(learning_rate=0.0001 * batch_size / 64)  # Linear LR scaling
+    if mixed_precision.global_policy().name == 'mixed_float16':
+        optimizer = mixed_precision.LossScaleOptimizer(optimizer)  # Avoid fp16 gradient underflow
+    
     model.compile(
-        optimizer=keras.optimizers.Adam(learning_rate=0.0001),
-        loss={
-            'profitable': 'binary_crossentropy',
-            'max_profit': 'mse',
-            'rug_risk': 'binary_crossentropy'
-        },
-        loss_weights={
-            'profitable': 1.0,  # Most important
-            'max_profit': 0.5,  # Somewhat important
-            'rug_risk': 1.0     # Very important (avoid rugs)
-        },
-        metrics={
-            'profitable': ['accuracy', keras.metrics.AUC(name='auc')],
-            'max_profit': ['mae'],
-            'rug_risk': ['accuracy', keras.metrics.AUC(name='auc')]
-        }
+        optimizer=optimizer,
+        loss=combined_loss,  # One loss call on the stacked heads
+        metrics=[
+            HeadAccuracy(PROFITABLE, name='profitable_accuracy'),
+            HeadAUC(PROFITABLE, name='profitable_auc'),
+            HeadMAE(MAX_PROFIT, name='max_profit_mae'),
+            HeadAccuracy(RUG_RISK, name='rug_risk_accuracy'),
+            HeadAUC(RUG_RISK, name='rug_risk_auc')
+        ],
+        run_eagerly=False,
+        steps_per_execution=32,  # Run 32 batches per compiled call before returning to Python
+        jit_compile=True  # XLA-compile the whole train/eval step
     )
     
     print(f"✅ Model created:")
     print(f"  - Total parameters: {model.count_params():,}")
-    print(f"  - Trainable parameters: {sum([tf.size(w).numpy() for w in model.trainable_weights]):,}")
+    print(f"  - Trainable parameters: {sum(int(np.prod(w.shape)) for w in model.trainable_weights):,}")
     
     return model
 
 
+def make_dataset(X: dict, y: np.ndarray, batch_size: int, shuffle: bool = False) -> tf.data.Dataset:
+    """
+    tf.data pipeline: shuffled, batched and prefetched so the next batch is
+    already on the GPU (prefetch_to_device) while it trains on the current one
+    
+    tf.data runs on the host, so the slices come from host float32 arrays
+    (no .cache(): from_tensor_slices already holds them in memory)
+    """
+    inputs = tuple(np.asarray(X[key], dtype=np.float32) for key in ('candles', 'ctx'))
+    outputs = np.asarray(y, dtype=np.float32)  # Stacked labels match the stacked 'heads' output
+    
+    ds = tf.data.Dataset.from_tensor_slices((inputs, outputs))
+    if shuffle:
+        ds = ds.shuffle(8192).batch(batch_size, drop_remainder=True)
+    else:
+        ds = ds.batch(batch_size)
+    if tf.config.list_physical_devices('GPU'):
+        # Must be the last transformation in the pipeline
+        return ds.apply(tf.data.experimental.prefetch_to_device('/GPU:0'))
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
 def train_model(model: Model, X_train: dict, y_train: np.ndarray, 
                 X_val: dict, y_val: np.ndarray, 
-                epochs: int = 100, batch_size: int = 64):
+                epochs: int = 100, batch_size: int = 192):
     """
     Train the model with callbacks
     
@@ -179,7 +304,7 @@ def train_model(model: Model, X_train: dict, y_train: np.ndarray,
         X_train, y_train: Training data
         X_val, y_val: Validation data
         epochs: Number of training epochs
-        batch_size: Batch size (64 optimized for GTX 1660)
+        batch_size: Batch size (192 fills the GTX 1660 under mixed precision; must match create_model)
     """
     print(f"\n🚀 Starting training (epochs={epochs}, batch_size={batch_size})...")
     print(f"🎮 GPU: {tf.config.list_physical_devices('GPU')}")
@@ -216,33 +341,20 @@ def train_model(model: Model, X_train: dict, y_train: np.ndarray,
         # TensorBoard logging
         keras.callbacks.TensorBoard(
             log_dir=f'../../logs/tensorboard_{datetime.now().strftime("%Y%m%d_%H%M%S")}',
-            histogram_freq=1
+            histogram_freq=0,  # Scalars only: weight histograms cost an extra pass every epoch
+            profile_batch=0
         )
     ]
     
-    # Prepare inputs
-    X_train_inputs = [X_train['candles'], X_train['context'], X_train['indicators']]
-    X_val_inputs = [X_val['candles'], X_val['context'], X_val['indicators']]
-    
-    # Prepare outputs (split multi-task labels)
-    y_train_outputs = {
-        'profitable': y_train[:, 0],
-        'max_profit': y_train[:, 1],
-        'rug_risk': y_train[:, 2]
-    }
-    y_val_outputs = {
-        'profitable': y_val[:, 0],
-        'max_profit': y_val[:, 1],
-        'rug_risk': y_val[:, 2]
-    }
+    # Input pipelines
+    train_ds = make_dataset(X_train, y_train, batch_size, shuffle=True)
+    val_ds = make_dataset(X_val, y_val, batch_size)
     
     # Train
     history = model.fit(
-        X_train_inputs,
-        y_train_outputs,
-        validation_data=(X_val_inputs, y_val_outputs),
+        train_ds,
+        validation_data=val_ds,
         epochs=epochs,
-        batch_size=batch_size,
         callbacks=callbacks,
         verbose=1
     )
@@ -264,14 +376,9 @@ def evaluate_model(model: Model, X_test: dict, y_test: np.ndarray):
     """
     print("\n📊 Evaluating model on test set...")
     
-    X_test_inputs = [X_test['candles'], X_test['context'], X_test['indicators']]
-    y_test_outputs = {
-        'profitable': y_test[:, 0],
-        'max_profit': y_test[:, 1],
-        'rug_risk': y_test[:, 2]
-    }
+    test_ds = make_dataset(X_test, y_test, batch_size=64)
     
-    results = model.evaluate(X_test_inputs, y_test_outputs, verbose=1)
+    results = model.evaluate(test_ds, verbose=1)
     
     print("\n📈 Test Results:")
     for i, metric_name in enumerate(model.metrics_names):
@@ -280,16 +387,35 @@ def evaluate_model(model: Model, X_test: dict, y_test: np.ndarray):
     return results
 
 
-def export_for_inference(model: Model, output_dir: str = '../../tfjs_model'):
+def export_for_inference(model: Model, output_dir: str = '../../tfjs_model',
+                         saved_model_dir: str = '../../saved_model'):
     """
     Export model to TensorFlow.js format for bot integration
+    
+    Goes through a SavedModel and converts it to a TFJS GraphModel, so the
+    converter constant-folds, fuses and prunes the graph once at export time
+    instead of the bot re-running it layer by layer
     """
     print(f"\n📦 Exporting model to TensorFlow.js format...")
     
-    tfjs.converters.save_keras_model(model, output_dir)
+    # Batch fixed to 1 (the bot predicts one setup at a time) so every shape is static
+    @tf.function(
+        input_signature=[tf.TensorSpec((1,) + tuple(inp.shape[1:]), tf.float32, name=inp.name) for inp in model.inputs]
+    )
+    def serve(candles_input, ctx_input):
+        return {'heads': model([candles_input, ctx_input], training=False)}
+    
+    model.save(saved_model_dir, save_format='tf',
+               signatures={'serving_default': serve.get_concrete_function()})
+    
+    # uint8 affine weight quantization: ~4x smaller download/load for the bot (dequantized at load time)
+    tfjs.converters.convert_tf_saved_model(
+        saved_model_dir, output_dir,
+        quantization_dtype_map={'uint8': True}
+    )
     
     print(f"✅ Model exported to {output_dir}")
-    print(f"   Use this in inference.ts with tf.loadLayersModel()")
+    print(f"   Use this in inference.ts with tf.loadGraphModel()")
 
 
 def main():
@@ -302,27 +428,17 @@ def main():
     
     # Load preprocessed data
     print("\n📂 Loading preprocessed data...")
-    data = np.load('../../processed_data.npz')
+    data = load_processed_data()  # Memory-mapped; cast to float32 once in make_dataset
     
-    X_train = {
-        'candles': data['X_train_candles'],
-        'context': data['X_train_context'],
-        'indicators': data['X_train_indicators']
-    }
-    X_val = {
-        'candles': data['X_val_candles'],
-        'context': data['X_val_context'],
-        'indicators': data['X_val_indicators']
-    }
-    X_test = {
-        'candles': data['X_test_candles'],
-        'context': data['X_test_context'],
-        'indicators': data['X_test_indicators']
-    }
+    X_train, X_val, X_test = {}, {}, {}
+    X_train['candles'], train_combined, y_train = load_split(data, 'train')
+    X_val['candles'], val_combined, y_val = load_split(data, 'val')
+    X_test['candles'], test_combined, y_test = load_split(data, 'test')
     
-    y_train = data['y_train']
-    y_val = data['y_val']
-    y_test = data['y_test']
+    # Scaled context (5) + indicators (5)
+    X_train['ctx'] = train_combined[:, :10]
+    X_val['ctx'] = val_combined[:, :10]
+    X_test['ctx'] = test_combined[:, :10]
     
     print(f"✅ Data loaded:")
     print(f"  Train: {len(y_train):,} examples")
@@ -332,11 +448,10 @@ def main():
     # Create model
     input_shapes = {
         'candles': (100, 5),
-        'context': (5,),
-        'indicators': (5,)
+        'ctx': (10,)
     }
     
-    model = create_model(input_shapes, batch_size=64)
+    model = create_model(input_shapes, batch_size=192)
     
     # Print model summary
     model.summary()
@@ -347,7 +462,7 @@ def main():
         X_train, y_train, 
         X_val, y_val,
         epochs=100,
-        batch_size=64
+        batch_size=192
     )
     
     # Evaluate on test set
@@ -7,6 +7,7 @@ Compatible with Python 3.14
 
 import sys
 import os
+import math
 
 # Fix Windows encoding for emoji/unicode characters
 if sys.platform == 'win32':
@@ -24,8 +25,10 @@ import torch.nn.functional as F
 from torch.utils.data import Dataset, DataLoader
 from sklearn.metrics import classification_report, confusion_matrix, roc_auc_score
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from preprocessor import load_processed_data, load_split
 
 # Set device
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -33,6 +36,24 @@ print(f"Using device: {device}")
 if torch.cuda.is_available():
     print(f"   GPU: {torch.cuda.get_device_name(0)}")
 
+# Let cuDNN benchmark its LSTM/matmul algorithms for our fixed training shapes (batch 64 with
+# drop_last, 100 candles) and cache the fastest; it may pick non-deterministic kernels, fine for training
+torch.backends.cudnn.benchmark = True
+
+# TF32 tensor-core matmuls/convolutions on Ampere+ (ignored on older GPUs)
+torch.backends.cuda.matmul.allow_tf32 = True
+torch.backends.cudnn.allow_tf32 = True
+
+# Mixed precision: bf16 where the GPU supports it, otherwise fp16 with loss scaling (e.g. GTX 1660)
+AMP_DTYPE = None
+if device.type == 'cuda':
+    AMP_DTYPE = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+
+
+def autocast():
+    """Autocast context for forward passes (no-op on CPU)"""
+    return torch.autocast(device_type=device.type, dtype=AMP_DTYPE, enabled=AMP_DTYPE is not None)
+
 
 class ScaledDotProductAttention(nn.Module):
     """
@@ -44,6 +65,7 @@ class ScaledDotProductAttention(nn.Module):
         self.d_model = d_model
         self.num_heads = num_heads
         self.d_head = d_model // num_heads
+        self.scale = 1.0 / math.sqrt(self.d_head)  # Softmax temperature, computed once
         
         assert d_model % num_heads == 0, "d_model must be divisible by num_heads"
         
@@ -54,7 +76,7 @@ class ScaledDotProductAttention(nn.Module):
         
         # Output projection
         self.out_linear = nn.Linear(d_model, d_model)
-        self.dropout = nn.Dropout(dropout)
+        self.dropout_p = dropout  # Applied to the attention weights inside SDPA
         
     def forward(self, x):
         """
@@ -71,15 +93,15 @@ class ScaledDotProductAttention(nn.Module):
         K = self.k_linear(x).view(batch_size, seq_len, self.num_heads, self.d_head).transpose(1, 2)
         V = self.v_linear(x).view(batch_size, seq_len, self.num_heads, self.d_head).transpose(1, 2)
         
-        # Scaled dot-product attention
-        # [batch, num_heads, seq_len, seq_len]
-        scores = torch.matmul(Q, K.transpose(-2, -1)) / np.sqrt(self.d_head)
-        attn_weights = F.softmax(scores, dim=-1)
-        attn_weights = self.dropout(attn_weights)
-        
-        # Apply attention to values
+        # Fused scaled dot-product attention (flash / memory-efficient kernel,
+        # never materializes the [batch, num_heads, seq_len, seq_len] score matrix)
         # [batch, num_heads, seq_len, d_head]
-        attn_output = torch.matmul(attn_weights, V)
+        attn_output = F.scaled_dot_product_attention(
+            Q, K, V,
+            dropout_p=self.dropout_p if self.training else 0.0,
+            is_causal=False,
+            scale=self.scale
+        )
         
         # Concatenate heads
         # [batch, seq_len, d_model]
@@ -102,9 +124,10 @@ class SnipeBTModel(nn.Module):
         - indicators: [batch, 13] - rsi, macd, ema_fast, ema_slow, bbands_width, + 8 EmperorBTC patterns
     
     Outputs:
-        - profitable: [batch, 1] - binary classification (0=loss, 1=profit)
+        - profitable: [batch, 1] - binary classification logit (0=loss, 1=profit)
         - max_profit: [batch, 1] - regression (max profit percentage)
-        - rug_risk: [batch, 1] - binary classification (0=safe, 1=rug)
+        - rug_risk: [batch, 1] - binary classification logit (0=safe, 1=rug)
+    Apply torch.sigmoid to the logits for probabilities (SnipeBTProbabilities does this for exports)
     """
     def __init__(self):
         super().__init__()
@@ -115,18 +138,19 @@ class SnipeBTModel(nn.Module):
             hidden_size=128,
             num_layers=1,
             batch_first=True,
-            bidirectional=True,
-            dropout=0.3
+            bidirectional=True
         )
         self.ln_lstm1 = nn.LayerNorm(256)  # BiLSTM output: 128 * 2 = 256
         
+        # LSTM(dropout=...) is ignored with num_layers=1, so dropout between the LSTMs is explicit
+        self.inter_lstm_dropout = nn.Dropout(0.3)
+        
         self.lstm2 = nn.LSTM(
             input_size=256,
             hidden_size=64,
             num_layers=1,
             batch_first=True,
-            bidirectional=True,
-            dropout=0.3
+            bidirectional=True
         )
         self.ln_lstm2 = nn.LayerNorm(128)  # BiLSTM output: 64 * 2 = 128
         
@@ -164,9 +188,12 @@ class SnipeBTModel(nn.Module):
         self.dropout_fc3 = nn.Dropout(0.3)
         
         # ===== OUTPUT HEADS =====
-        self.profitable_head = nn.Linear(64, 1)
-        self.max_profit_head = nn.Linear(64, 1)
-        self.rug_risk_head = nn.Linear(64, 1)
+        # One Linear for all three heads: columns = profitable, max_profit, rug_risk
+        self.output_head = nn.Linear(64, 3)
+        
+        # Keep each LSTM's weights in one contiguous cuDNN buffer (single fused RNN call per layer)
+        self.lstm1.flatten_parameters()
+        self.lstm2.flatten_parameters()
         
     def forward(self, candles, combined):
         """
@@ -184,7 +211,7 @@ class SnipeBTModel(nn.Module):
         x1 = self.ln_lstm1(x1)
         
         # Second BiLSTM
-        x2, _ = self.lstm2(x1)  # [batch, 30, 128]
+        x2, _ = self.lstm2(self.inter_lstm_dropout(x1))  # [batch, 30, 128]
         x2 = self.ln_lstm2(x2)
         
         # Residual connection (project x1 from 256 to 128)
@@ -232,19 +259,49 @@ class SnipeBTModel(nn.Module):
         fc3 = self.dropout_fc3(fc3)
         
         # ===== OUTPUT HEADS =====
-        profitable = torch.sigmoid(self.profitable_head(fc3))  # [batch, 1]
-        max_profit = self.max_profit_head(fc3)  # [batch, 1] - linear for regression
-        rug_risk = torch.sigmoid(self.rug_risk_head(fc3))  # [batch, 1]
+        # Classification heads return logits: sigmoid is fused into the loss (BCE with logits)
+        heads = self.output_head(fc3)  # [batch, 3]
+        profitable = heads[:, 0:1]  # [batch, 1]
+        max_profit = heads[:, 1:2]  # [batch, 1] - linear for regression
+        rug_risk = heads[:, 2:3]  # [batch, 1]
         
         return profitable, max_profit, rug_risk
+    
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # Checkpoints from before the fused head: stack the three Linear(64, 1) heads into output_head
+        old_heads = [f'{prefix}{name}_head' for name in ('profitable', 'max_profit', 'rug_risk')]
+        if f'{old_heads[0]}.weight' in state_dict:
+            for param in ('weight', 'bias'):
+                state_dict[f'{prefix}output_head.{param}'] = torch.cat(
+                    [state_dict.pop(f'{head}.{param}') for head in old_heads])
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+
+class SnipeBTProbabilities(nn.Module):
+    """
+    SnipeBTModel with sigmoid applied to the classification logits
+    Used for exported models whose consumers expect probabilities
+    """
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+    
+    def forward(self, candles, combined):
+        profitable, max_profit, rug_risk = self.model(candles, combined)
+        return torch.sigmoid(profitable), max_profit, torch.sigmoid(rug_risk)
 
 
 class TradingDataset(Dataset):
-    """PyTorch Dataset for trading data"""
-    def __init__(self, X_candles, X_combined, y):
-        self.candles = torch.FloatTensor(X_candles)
-        self.combined = torch.FloatTensor(X_combined)  # 18 features: context + indicators + patterns
-        self.y = torch.FloatTensor(y)
+    """PyTorch Dataset for trading data (tensors live on `device`)"""
+    def __init__(self, X_candles, X_combined, y, device='cpu'):
+        self.candles = torch.tensor(X_candles, dtype=torch.float32, device=device)
+        self.combined = torch.tensor(X_combined, dtype=torch.float32, device=device)  # 18 features: context + indicators + patterns
+        
+        # One contiguous tensor per label, split once instead of on every lookup
+        y = torch.tensor(y, dtype=torch.float32, device=device)
+        self.profitable = y[:, 0].contiguous()
+        self.max_profit = y[:, 1].contiguous()
+        self.rug_risk = y[:, 2].contiguous()
         
     def __len__(self):
         return len(self.candles)
@@ -253,12 +310,102 @@ class TradingDataset(Dataset):
         return {
             'candles': self.candles[idx],
             'combined': self.combined[idx],
-            'profitable': self.y[idx, 0],
-            'max_profit': self.y[idx, 1],
-            'rug_risk': self.y[idx, 2]
+            'profitable': self.profitable[idx],
+            'max_profit': self.max_profit[idx],
+            'rug_risk': self.rug_risk[idx]
         }
 
 
+class DeviceDataLoader:
+    """
+    Batches a TradingDataset that already lives on the training device by indexing it
+    No worker processes, pinning or per-batch host->device copies
+    """
+    def __init__(self, dataset, batch_size=64, shuffle=False, drop_last=False):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+    
+    def __len__(self):
+        if self.drop_last:
+            return len(self.dataset) // self.batch_size
+        return (len(self.dataset) + self.batch_size - 1) // self.batch_size
+    
+    def __iter__(self):
+        n = len(self.dataset)
+        indices = torch.randperm(n, device=self.dataset.candles.device) if self.shuffle else None
+        for start in range(0, len(self) * self.batch_size, self.batch_size):
+            if indices is not None:
+                yield self.dataset[indices[start:start + self.batch_size]]
+            else:
+                yield self.dataset[start:start + self.batch_size]
+
+
+class PrefetchLoader:
+    """
+    Wraps a host DataLoader and copies the next batch to the GPU on a side CUDA stream
+    while the current batch is being trained on, hiding the H2D transfer
+    """
+    def __init__(self, loader, device):
+        self.loader = loader
+        self.device = device
+        self.batch_size = loader.batch_size
+        self.stream = torch.cuda.Stream(device=device)
+    
+    def __len__(self):
+        return len(self.loader)
+    
+    def _to_device(self, batch):
+        with torch.cuda.stream(self.stream):
+            return {key: value.to(self.device, non_blocking=True) for key, value in batch.items()}
+    
+    def __iter__(self):
+        batches = iter(self.loader)
+        next_batch = next(batches, None)
+        next_batch = self._to_device(next_batch) if next_batch is not None else None
+        
+        while next_batch is not None:
+            torch.cuda.current_stream(self.device).wait_stream(self.stream)
+            batch = next_batch
+            for value in batch.values():
+                value.record_stream(torch.cuda.current_stream(self.device))  # Don't recycle while in use
+            
+            # Start copying the following batch before handing this one out
+            following = next(batches, None)
+            next_batch = self._to_device(following) if following is not None else None
+            yield batch
+
+
+def create_loaders(splits, batch_size=64):
+    """
+    Loaders for {'train': (candles, combined, y), 'val': ..., 'test': ...}
+    Each split is uploaded to the device once and batched there; if it does not fit
+    in GPU memory, falls back to DataLoader workers streaming from pinned host memory
+    with the copies overlapped with compute (PrefetchLoader)
+    """
+    try:
+        datasets = {name: TradingDataset(*arrays, device=device) for name, arrays in splits.items()}
+        return {
+            name: DeviceDataLoader(dataset, batch_size, shuffle=(name == 'train'),
+                                   drop_last=(name == 'train'))  # Fixed batch shape for the compiled model
+            for name, dataset in datasets.items()
+        }
+    except torch.cuda.OutOfMemoryError:
+        torch.cuda.empty_cache()
+        print("⚠️  Dataset does not fit in GPU memory, streaming batches from host")
+    
+    datasets = {name: TradingDataset(*arrays) for name, arrays in splits.items()}
+    loaders = {
+        'train': DataLoader(datasets['train'], batch_size=batch_size, shuffle=True, num_workers=4, pin_memory=True,
+                            persistent_workers=True, drop_last=True),
+        'val': DataLoader(datasets['val'], batch_size=batch_size, shuffle=False, num_workers=2, pin_memory=True,
+                          persistent_workers=True),
+        'test': DataLoader(datasets['test'], batch_size=batch_size, shuffle=False, num_workers=2, pin_memory=True)
+    }
+    return {name: PrefetchLoader(loader, device) for name, loader in loaders.items()}
+
+
 def compute_class_weights(y_train):
     """Compute class weights for imbalanced data"""
     from sklearn.utils.class_weight import compute_class_weight
@@ -289,8 +436,8 @@ def compute_class_weights(y_train):
 
 def get_sample_weights(y_train, class_weights):
     """Get sample weights for each training example"""
-    profitable_weights = np.array([class_weights['profitable'][int(y)] for y in y_train[:, 0]])
-    rug_weights = np.array([class_weights['rug_risk'][int(y)] for y in y_train[:, 2]])
+    profitable_weights = np.asarray(class_weights['profitable'])[y_train[:, 0].astype(np.int64)]
+    rug_weights = np.asarray(class_weights['rug_risk'])[y_train[:, 2].astype(np.int64)]
     
     # Average the weights for overall sample weighting
     sample_weights = (profitable_weights + rug_weights) / 2.0
@@ -310,11 +457,17 @@ class WeightedMultiTaskLoss(nn.Module):
         # Handle single-class case (no rugs in dataset)
         self.rug_weight_1 = class_weights['rug_risk'][1] if len(class_weights['rug_risk']) > 1 else 1.0
         
+        # Per-class weight lookup tables (indexed by the 0/1 label; move with .to(device))
+        self.register_buffer('profitable_weights', torch.tensor(
+            [self.profitable_weight_0, self.profitable_weight_1], dtype=torch.float32))
+        self.register_buffer('rug_weights', torch.tensor(
+            [self.rug_weight_0, self.rug_weight_1], dtype=torch.float32))
+        
     def forward(self, profitable_pred, max_profit_pred, rug_pred, 
                 profitable_true, max_profit_true, rug_true):
         """
         Args:
-            *_pred: Model predictions
+            *_pred: Model predictions (logits for profitable/rug_risk)
             *_true: Ground truth labels
         Returns:
             total_loss, profitable_loss, max_profit_loss, rug_loss
@@ -324,36 +477,24 @@ class WeightedMultiTaskLoss(nn.Module):
         max_profit_pred = max_profit_pred.view(-1)
         rug_pred = rug_pred.view(-1)
         
-        # Binary cross-entropy with class weights
-        bce_profitable = F.binary_cross_entropy(
+        # Binary cross-entropy with class weights (sigmoid fused in, numerically stable)
+        weights_profitable = self.profitable_weights[profitable_true.long()]
+        profitable_loss = F.binary_cross_entropy_with_logits(
             profitable_pred,
             profitable_true,
-            reduction='none'
+            weight=weights_profitable
         )
-        # Apply class weights
-        weights_profitable = torch.where(
-            profitable_true == 1,
-            torch.tensor(self.profitable_weight_1, device=bce_profitable.device),
-            torch.tensor(self.profitable_weight_0, device=bce_profitable.device)
-        )
-        profitable_loss = (bce_profitable * weights_profitable).mean()
         
         # MSE for regression (max_profit)
         max_profit_loss = F.mse_loss(max_profit_pred, max_profit_true)
         
         # Binary cross-entropy with class weights for rug risk
-        bce_rug = F.binary_cross_entropy(
+        weights_rug = self.rug_weights[rug_true.long()]
+        rug_loss = F.binary_cross_entropy_with_logits(
             rug_pred,
             rug_true,
-            reduction='none'
-        )
-        # Apply class weights
-        weights_rug = torch.where(
-            rug_true == 1,
-            torch.tensor(self.rug_weight_1, device=bce_rug.device),
-            torch.tensor(self.rug_weight_0, device=bce_rug.device)
+            weight=weights_rug
         )
-        rug_loss = (bce_rug * weights_rug).mean()
         
         # Task-specific loss weights (matching TensorFlow version)
         total_loss = 1.0 * profitable_loss + 0.5 * max_profit_loss + 1.0 * rug_loss
@@ -361,6 +502,35 @@ class WeightedMultiTaskLoss(nn.Module):
         return total_loss, profitable_loss, max_profit_loss, rug_loss
 
 
+# Checkpoints are pickled and written on a background thread, off the training loop
+_save_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def _to_cpu(obj):
+    """Detached CPU copy of every tensor in a (nested) state dict; containers are copied too"""
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {key: _to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(value) for value in obj)
+    return obj
+
+
+def _write_checkpoint(state, path):
+    tmp_path = f"{path}.tmp"
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)  # Never leave a half-written checkpoint behind
+
+
+def save_checkpoint_async(state, path):
+    """
+    Snapshot `state` to CPU now (cheap), serialize and write it in the background
+    Returns a Future; writes happen in submission order
+    """
+    return _save_executor.submit(_write_checkpoint, _to_cpu(state), path)
+
+
 def create_lr_schedule(initial_lr=0.0001, warmup_epochs=10, total_epochs=100):
     """
     Learning rate schedule with warmup and cosine annealing
@@ -377,8 +547,27 @@ def create_lr_schedule(initial_lr=0.0001, warmup_epochs=10, total_epochs=100):
     return lr_lambda
 
 
-def train_epoch(model, train_loader, criterion, optimizer, device):
-    """Train for one epoch"""
+def _maybe_compile(model):
+    """
+    torch.compile the model for training on CUDA (Inductor fuses the Linear/ReLU/LayerNorm/Dropout
+    chains and each LayerNorm with its residual add, CUDA graphs remove per-step launch overhead);
+    eager everywhere else
+    Returns a wrapper sharing the model's parameters, so checkpoints keep saving the plain model
+    """
+    if device.type != 'cuda':
+        return model
+    try:
+        import triton  # noqa: F401 - Inductor's GPU code generator
+    except ImportError:
+        print("⚠️  Triton not installed, training in eager mode")
+        return model
+    
+    # Static shapes (drop_last=True on the train loader) so Inductor specializes and CUDA graphs replay
+    return torch.compile(model, mode='reduce-overhead', dynamic=False)
+
+
+def train_epoch(model, train_loader, criterion, optimizer, device, scaler=None):
+    """Train for one epoch (scaler: GradScaler for fp16 autocast)"""
     model.train()
     total_loss = 0.0
     profitable_loss_sum = 0.0
@@ -392,23 +581,32 @@ def train_epoch(model, train_loader, criterion, optimizer, device):
         max_profit_true = batch['max_profit'].to(device)
         rug_true = batch['rug_risk'].to(device)
         
-        # Forward pass
-        profitable_pred, max_profit_pred, rug_pred = model(candles, combined)
+        # Forward pass (mixed precision)
+        with autocast():
+            profitable_pred, max_profit_pred, rug_pred = model(candles, combined)
         
-        # Compute loss
+        # Compute loss in fp32
         loss, p_loss, mp_loss, r_loss = criterion(
-            profitable_pred, max_profit_pred, rug_pred,
+            profitable_pred.float(), max_profit_pred.float(), rug_pred.float(),
             profitable_true, max_profit_true, rug_true
         )
         
         # Backward pass
-        optimizer.zero_grad()
-        loss.backward()
+        optimizer.zero_grad(set_to_none=True)
+        if scaler is not None:
+            scaler.scale(loss).backward()
+            scaler.unscale_(optimizer)  # Clip the real gradients, not the scaled ones
+        else:
+            loss.backward()
         
         # Gradient clipping (matching TensorFlow clipnorm=1.0)
         torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
         
-        optimizer.step()
+        if scaler is not None:
+            scaler.step(optimizer)
+            scaler.update()
+        else:
+            optimizer.step()
         
         # Accumulate losses
         total_loss += loss.item()
@@ -426,18 +624,17 @@ def train_epoch(model, train_loader, criterion, optimizer, device):
 
 
 def validate_epoch(model, val_loader, criterion, device):
-    """Validate for one epoch"""
+    """
+    Validate for one epoch
+    Losses and predictions are accumulated on the device and copied to the host once at the end
+    """
     model.eval()
-    total_loss = 0.0
-    profitable_loss_sum = 0.0
-    max_profit_loss_sum = 0.0
-    rug_loss_sum = 0.0
+    loss_sums = torch.zeros(4, device=device)  # total, profitable, max_profit, rug_risk
+    max_profit_abs_error = torch.zeros((), device=device)
     
     # For metrics
     all_profitable_preds = []
     all_profitable_true = []
-    all_max_profit_preds = []
-    all_max_profit_true = []
     all_rug_preds = []
     all_rug_true = []
     
@@ -450,54 +647,51 @@ def validate_epoch(model, val_loader, criterion, device):
             rug_true = batch['rug_risk'].to(device)
             
             # Forward pass
-            profitable_pred, max_profit_pred, rug_pred = model(candles, combined)
+            with autocast():
+                profitable_pred, max_profit_pred, rug_pred = model(candles, combined)
+            profitable_pred, max_profit_pred, rug_pred = profitable_pred.float(), max_profit_pred.float(), rug_pred.float()
             # Compute loss
             loss, p_loss, mp_loss, r_loss = criterion(
                 profitable_pred, max_profit_pred, rug_pred,
                 profitable_true, max_profit_true, rug_true
             )
             
-            # Accumulate losses
-            total_loss += loss.item()
-            profitable_loss_sum += p_loss.item()
-            max_profit_loss_sum += mp_loss.item()
-            rug_loss_sum += r_loss.item()
+            # Accumulate losses (no .item(): that would sync with the GPU every batch)
+            loss_sums += torch.stack([loss, p_loss, mp_loss, r_loss])
+            max_profit_abs_error += (max_profit_pred.view(-1) - max_profit_true).abs().sum()
             
-            # Store predictions for metrics
-            all_profitable_preds.extend(profitable_pred.cpu().numpy())
-            all_profitable_true.extend(profitable_true.cpu().numpy())
-            all_max_profit_preds.extend(max_profit_pred.cpu().numpy())
-            all_max_profit_true.extend(max_profit_true.cpu().numpy())
-            all_rug_preds.extend(rug_pred.cpu().numpy())
-            all_rug_true.extend(rug_true.cpu().numpy())
+            # Store predictions for metrics (probabilities)
+            all_profitable_preds.append(torch.sigmoid(profitable_pred).view(-1))
+            all_profitable_true.append(profitable_true)
+            all_rug_preds.append(torch.sigmoid(rug_pred).view(-1))
+            all_rug_true.append(rug_true)
     
     num_batches = len(val_loader)
+    total_loss, profitable_loss, max_profit_loss, rug_loss = (loss_sums / num_batches).tolist()
     
     # Calculate metrics
-    all_profitable_preds = np.array(all_profitable_preds).flatten()
-    all_profitable_true = np.array(all_profitable_true).flatten()
-    all_rug_preds = np.array(all_rug_preds).flatten()
-    all_rug_true = np.array(all_rug_true).flatten()
-    
-    # AUC scores
-    profitable_auc = roc_auc_score(all_profitable_true, all_profitable_preds)
-    rug_auc = roc_auc_score(all_rug_true, all_rug_preds)
+    all_profitable_preds = torch.cat(all_profitable_preds)
+    all_profitable_true = torch.cat(all_profitable_true)
+    all_rug_preds = torch.cat(all_rug_preds)
+    all_rug_true = torch.cat(all_rug_true)
     
     # Accuracy
-    profitable_acc = ((all_profitable_preds > 0.5) == all_profitable_true).mean()
-    rug_acc = ((all_rug_preds > 0.5) == all_rug_true).mean()
+    profitable_acc = ((all_profitable_preds > 0.5).float() == all_profitable_true).float().mean().item()
+    rug_acc = ((all_rug_preds > 0.5).float() == all_rug_true).float().mean().item()
     
     # MAE for regression
-    all_max_profit_preds = np.array(all_max_profit_preds).flatten()
-    all_max_profit_true = np.array(all_max_profit_true).flatten()
-    max_profit_mae = np.abs(all_max_profit_preds - all_max_profit_true).mean()
+    max_profit_mae = (max_profit_abs_error / len(all_profitable_true)).item()
+    
+    # AUC scores
+    profitable_auc = roc_auc_score(all_profitable_true.cpu().numpy(), all_profitable_preds.cpu().numpy())
+    rug_auc = roc_auc_score(all_rug_true.cpu().numpy(), all_rug_preds.cpu().numpy())
     
     return {
         'loss': {
-            'total': total_loss / num_batches,
-            'profitable': profitable_loss_sum / num_batches,
-            'max_profit': max_profit_loss_sum / num_batches,
-            'rug_risk': rug_loss_sum / num_batches
+            'total': total_loss,
+            'profitable': profitable_loss,
+            'max_profit': max_profit_loss,
+            'rug_risk': rug_loss
         },
         'metrics': {
             'profitable_auc': profitable_auc,
@@ -520,10 +714,18 @@ def train_model(model, train_loader, val_loader, class_weights,
     print(f"  - Gradient clipping: 1.0")
     print(f"  - Class balancing: Enabled")
     print(f"  - Device: {device}")
+    print(f"  - Mixed precision: {AMP_DTYPE or 'off'}")
+    
+    # Compiled wrapper for the forward/backward passes; `model` itself is what gets saved
+    compiled_model = _maybe_compile(model)
     
     # Loss function and optimizer
-    criterion = WeightedMultiTaskLoss(class_weights)
-    optimizer = torch.optim.AdamW(model.parameters(), lr=initial_lr)
+    criterion = WeightedMultiTaskLoss(class_weights).to(device)
+    # Fused AdamW: one CUDA kernel updates every parameter tensor
+    optimizer = torch.optim.AdamW(model.parameters(), lr=initial_lr, fused=(device.type == 'cuda'))
+    
+    # fp16 needs loss scaling to keep small gradients from underflowing; bf16 does not
+    scaler = torch.amp.GradScaler('cuda') if AMP_DTYPE == torch.float16 else None
     
     # Learning rate scheduler
     lr_lambda = create_lr_schedule(initial_lr, warmup_epochs, epochs)
@@ -548,13 +750,18 @@ def train_model(model, train_loader, val_loader, class_weights,
     best_model_path = os.path.join(ROOT_DIR, 'best_model_pytorch.pth')
     checkpoint_path = os.path.join(ROOT_DIR, 'training_checkpoint.pth')
     start_epoch = 0
+    pending_saves = []
     
     # Resume from checkpoint if exists
     if os.path.exists(checkpoint_path):
         print(f"📥 Resuming from checkpoint...")
         checkpoint = torch.load(checkpoint_path, weights_only=False)
         model.load_state_dict(checkpoint['model_state_dict'])
-        optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+        try:
+            optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+        except ValueError:
+            # Checkpoint from before the fused output head: parameter groups no longer line up
+            print("  ⚠️ Optimizer state does not match the model, starting optimizer fresh")
         start_epoch = checkpoint['epoch'] + 1
         best_val_auc = checkpoint.get('best_val_auc', 0.0)
         history = checkpoint.get('history', history)
@@ -563,10 +770,10 @@ def train_model(model, train_loader, val_loader, class_weights,
     # Training loop
     for epoch in range(start_epoch, epochs):
         # Train
-        train_losses = train_epoch(model, train_loader, criterion, optimizer, device)
+        train_losses = train_epoch(compiled_model, train_loader, criterion, optimizer, device, scaler)
         
         # Validate
-        val_results = validate_epoch(model, val_loader, criterion, device)
+        val_results = validate_epoch(compiled_model, val_loader, criterion, device)
         
         # Update learning rate
         current_lr = optimizer.param_groups[0]['lr']
@@ -598,13 +805,13 @@ def train_model(model, train_loader, val_loader, class_weights,
             best_val_auc = val_auc
             patience_counter = 0
             # Save best model
-            torch.save({
+            pending_saves.append(save_checkpoint_async({
                 'epoch': epoch,
                 'model_state_dict': model.state_dict(),
                 'optimizer_state_dict': optimizer.state_dict(),
                 'val_auc': val_auc,
                 'history': history
-            }, best_model_path)
+            }, best_model_path))
             print(f"  ✅ New best model saved! Val AUC: {val_auc:.4f}")
         else:
             patience_counter += 1
@@ -616,13 +823,17 @@ def train_model(model, train_loader, val_loader, class_weights,
         
         # Save checkpoint every 5 epochs for crash recovery
         if (epoch + 1) % 5 == 0:
-            torch.save({
+            pending_saves.append(save_checkpoint_async({
                 'epoch': epoch,
                 'model_state_dict': model.state_dict(),
                 'optimizer_state_dict': optimizer.state_dict(),
                 'best_val_auc': best_val_auc,
                 'history': history
-            }, checkpoint_path)
+            }, checkpoint_path))
+    
+    # Wait for background checkpoint writes (and surface any write error)
+    for future in pending_saves:
+        future.result()
     
     # Load best model
     print(f"\n📥 Loading best model (Val AUC: {best_val_auc:.4f})...")
@@ -661,12 +872,12 @@ def evaluate_model(model, test_loader, device):
             
             profitable_pred, max_profit_pred, rug_pred = model(candles, combined)
             
-            all_profitable_preds.extend(profitable_pred.cpu().numpy())
-            all_profitable_true.extend(batch['profitable'].numpy())
+            all_profitable_preds.extend(torch.sigmoid(profitable_pred).cpu().numpy())
+            all_profitable_true.extend(batch['profitable'].cpu().numpy())
             all_max_profit_preds.extend(max_profit_pred.cpu().numpy())
-            all_max_profit_true.extend(batch['max_profit'].numpy())
-            all_rug_preds.extend(rug_pred.cpu().numpy())
-            all_rug_true.extend(batch['rug_risk'].numpy())
+            all_max_profit_true.extend(batch['max_profit'].cpu().numpy())
+            all_rug_preds.extend(torch.sigmoid(rug_pred).cpu().numpy())
+            all_rug_true.extend(batch['rug_risk'].cpu().numpy())
     
     # Convert to numpy
     all_profitable_preds = np.array(all_profitable_preds).flatten()
@@ -707,12 +918,41 @@ def evaluate_model(model, test_loader, device):
         print(f"  Accuracy: {((rug_binary == all_rug_true).mean()):.4f}")
 
 
-def export_for_inference(model, output_path='../../model_pytorch_scripted.pt'):
+def export_for_inference(model, output_path='../../model_pytorch_scripted.pt', quantize=True):
     """
-    Export model to TorchScript for TypeScript inference
+    Export model to TorchScript for TypeScript inference (outputs probabilities)
+    quantize: int8 dynamic quantization of the Linear/LSTM weights (CPU inference, ~4x smaller)
     """
     print(f"\n📦 Exporting model to TorchScript...")
     
+    model.eval()
+    model = SnipeBTProbabilities(model.cpu())  # Move to CPU for export, sigmoid on the logits
+    
+    if quantize:
+        # Returns a quantized copy; the fp32 model passed in is left untouched
+        model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear, nn.LSTM}, dtype=torch.qint8)
+    
+    # Script (not trace): no example shape baked in, control flow kept
+    scripted_model = torch.jit.script(model)
+    
+    # Freeze and apply inference graph rewrites (fold constants, fuse ops, drop dropout)
+    scripted_model = torch.jit.optimize_for_inference(scripted_model)
+    
+    # Save scripted model
+    scripted_model.save(output_path)
+    
+    print(f"✅ Model exported to {output_path}")
+    print(f"   Format: TorchScript{' (int8 dynamic quantization)' if quantize else ''} (can be loaded in TypeScript with ONNX Runtime)")
+
+
+def export_onnx(model, output_path='../../snipebt.onnx', quantize=True):
+    """
+    Export model to ONNX (dynamic batch axis) for ONNX Runtime inference
+    Outputs raw logits like SnipeBTModel; inference.py applies the sigmoid
+    Optionally writes an int8 dynamically-quantized copy next to it for CPU serving
+    """
+    print(f"\n📦 Exporting model to ONNX...")
+    
     model.eval()
     model = model.cpu()  # Move to CPU for export
     
@@ -720,14 +960,30 @@ def export_for_inference(model, output_path='../../model_pytorch_scripted.pt'):
     example_candles = torch.randn(1, 100, 5)
     example_combined = torch.randn(1, 18)  # 5 context + 5 indicators + 8 patterns
     
-    # Trace the model
-    traced_model = torch.jit.trace(model, (example_candles, example_combined))
+    input_names = ['candles', 'combined']
+    output_names = ['profitable', 'max_profit', 'rug_risk']
+    torch.onnx.export(
+        model,
+        (example_candles, example_combined),
+        output_path,
+        input_names=input_names,
+        output_names=output_names,
+        dynamic_axes={name: {0: 'batch'} for name in input_names + output_names},
+        opset_version=17
+    )
+    print(f"✅ Model exported to {output_path}")
     
-    # Save traced model
-    traced_model.save(output_path)
+    if not quantize:
+        return
+    try:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+    except ImportError:
+        print("⚠️  onnxruntime not installed, skipping int8 quantization")
+        return
     
-    print(f"✅ Model exported to {output_path}")
-    print(f"   Format: TorchScript (can be loaded in TypeScript with ONNX Runtime)")
+    quantized_path = str(output_path).replace('.onnx', '.int8.onnx')
+    quantize_dynamic(output_path, quantized_path, weight_type=QuantType.QInt8)
+    print(f"✅ Int8 model exported to {quantized_path}")
 
 
 def main():
@@ -740,19 +996,11 @@ def main():
     
     # Load preprocessed data
     print("\n📂 Loading preprocessed data...")
-    data = np.load(os.path.join(ROOT_DIR, 'processed_data.npz'))
+    data = load_processed_data()
     
-    X_train_candles = data['X_train_candles']
-    X_train_combined = data['X_train_combined']  # 18 features: context + indicators + patterns
-    y_train = data['y_train']
-    
-    X_val_candles = data['X_val_candles']
-    X_val_combined = data['X_val_combined']
-    y_val = data['y_val']
-    
-    X_test_candles = data['X_test_candles']
-    X_test_combined = data['X_test_combined']
-    y_test = data['y_test']
+    X_train_candles, X_train_combined, y_train = load_split(data, 'train')  # combined: 18 features (context + indicators + patterns)
+    X_val_candles, X_val_combined, y_val = load_split(data, 'val')
+    X_test_candles, X_test_combined, y_test = load_split(data, 'test')
     
     print(f"✅ Data loaded:")
     print(f"  Train: {len(X_train_candles)} examples")
@@ -762,15 +1010,13 @@ def main():
     # Compute class weights
     class_weights = compute_class_weights(y_train)
     
-    # Create datasets
-    train_dataset = TradingDataset(X_train_candles, X_train_combined, y_train)
-    val_dataset = TradingDataset(X_val_candles, X_val_combined, y_val)
-    test_dataset = TradingDataset(X_test_candles, X_test_combined, y_test)
-    
-    # Create dataloaders with parallel loading
-    train_loader = DataLoader(train_dataset, batch_size=64, shuffle=True, num_workers=4, pin_memory=True, persistent_workers=True)
-    val_loader = DataLoader(val_dataset, batch_size=64, shuffle=False, num_workers=2, pin_memory=True, persistent_workers=True)
-    test_loader = DataLoader(test_dataset, batch_size=64, shuffle=False, num_workers=2, pin_memory=True)
+    # Create dataloaders (dataset uploaded to the device once)
+    loaders = create_loaders({
+        'train': (X_train_candles, X_train_combined, y_train),
+        'val': (X_val_candles, X_val_combined, y_val),
+        'test': (X_test_candles, X_test_combined, y_test)
+    }, batch_size=64)
+    train_loader, val_loader, test_loader = loaders['train'], loaders['val'], loaders['test']
     
     # Create model
     print("\n🏗️ Creating model...")
@@ -800,10 +1046,12 @@ def main():
     
     # Export for inference
     export_for_inference(model)
+    export_onnx(model)
     
     print("\n✅ Training pipeline complete!")
     print(f"   Best model: ../../best_model_pytorch.pth")
     print(f"   TorchScript: ../../model_pytorch_scripted.pt")
+    print(f"   ONNX: ../../snipebt.onnx")
     print(f"   History: ../../training_history_pytorch.json")
 
 
@@ -15,6 +15,7 @@ import json
 import tensorflowjs as tfjs
 from datetime import datetime
 from sklearn.utils.class_weight import compute_class_weight
+from preprocessor import load_processed_data
 
 
 class ScaledDotProductAttention(layers.Layer):
@@ -29,28 +30,29 @@ class ScaledDotProductAttention(layers.Layer):
         
         assert d_model % self.num_heads == 0
         self.depth = d_model // self.num_heads
+        self.scale = 1.0 / float(np.sqrt(self.depth))  # Static constant: BMM -> Scale -> Softmax -> BMM for XLA
         
     def build(self, input_shape):
-        # Query, Key, Value projection matrices
-        self.wq = self.add_weight(
-            name='query_weight',
-            shape=(input_shape[-1], self.d_model),
+        # Fused Query/Key/Value projection matrix (one GEMM instead of three)
+        self.w_qkv = self.add_weight(
+            name='qkv_weight',
+            shape=(input_shape[-1], 3 * self.d_model),
             initializer='glorot_uniform',
             trainable=True
         )
-        self.wk = self.add_weight(
-            name='key_weight',
-            shape=(input_shape[-1], self.d_model),
+        # Output projection kept per head (num_heads, depth, out) so merging heads is one einsum
+        self.out_kernel = self.add_weight(
+            name='output_kernel',
+            shape=(self.num_heads, self.depth, input_shape[-1]),
             initializer='glorot_uniform',
             trainable=True
         )
-        self.wv = self.add_weight(
-            name='value_weight',
-            shape=(input_shape[-1], self.d_model),
-            initializer='glorot_uniform',
+        self.out_bias = self.add_weight(
+            name='output_bias',
+            shape=(input_shape[-1],),
+            initializer='zeros',
             trainable=True
         )
-        self.dense = layers.Dense(input_shape[-1])
         super(ScaledDotProductAttention, self).build(input_shape)
     
     def split_heads(self, x, batch_size):
@@ -62,9 +64,8 @@ class ScaledDotProductAttention(layers.Layer):
         batch_size = tf.shape(inputs)[0]
         
         # Linear projections
-        q = tf.matmul(inputs, self.wq)  # (batch, seq_len, d_model)
-        k = tf.matmul(inputs, self.wk)
-        v = tf.matmul(inputs, self.wv)
+        qkv = tf.matmul(inputs, self.w_qkv)  # (batch, seq_len, 3 * d_model)
+        q, k, v = tf.split(qkv, 3, axis=-1)  # (batch, seq_len, d_model) each
         
         # Split into multiple heads
         q = self.split_heads(q, batch_size)  # (batch, num_heads, seq_len, depth)
@@ -75,21 +76,17 @@ class ScaledDotProductAttention(layers.Layer):
         matmul_qk = tf.matmul(q, k, transpose_b=True)  # (batch, num_heads, seq_len, seq_len)
         
         # Scale by sqrt(dk)
-        dk = tf.cast(tf.shape(k)[-1], tf.float32)
-        scaled_attention_logits = matmul_qk / tf.math.sqrt(dk)
+        scaled_attention_logits = matmul_qk * self.scale
         
-        # Softmax to get attention weights
-        attention_weights = tf.nn.softmax(scaled_attention_logits, axis=-1)
+        # Softmax to get attention weights (in float32 for stability under mixed precision)
+        attention_weights = tf.nn.softmax(tf.cast(scaled_attention_logits, tf.float32), axis=-1)
+        attention_weights = tf.cast(attention_weights, v.dtype)
         
         # Apply attention to values
         output = tf.matmul(attention_weights, v)  # (batch, num_heads, seq_len, depth)
         
-        # Concatenate heads
-        output = tf.transpose(output, perm=[0, 2, 1, 3])  # (batch, seq_len, num_heads, depth)
-        concat_attention = tf.reshape(output, (batch_size, -1, self.d_model))
-        
-        # Final linear projection
-        output = self.dense(concat_attention)
+        # Concatenate heads + final linear projection in one contraction (no transposed copy)
+        output = tf.einsum('bhsd,hdo->bso', output, self.out_kernel) + self.out_bias
         
         return output
     
@@ -136,14 +133,17 @@ def create_model(input_shapes: dict, batch_size: int = 64) -> Model:
     # ===== CANDLE PROCESSING (LSTM + ATTENTION + RESIDUALS) =====
     
     # First BiLSTM layer
+    # No recurrent_dropout: it adds a dropout mask to every recurrent step. The model is compiled
+    # with jit_compile=True, and XLA has no CudnnRNN kernel, so these run as the generic LSTM loop
+    # (they would only pick the fused cuDNN kernel when compiled without XLA)
     x1 = layers.Bidirectional(
-        layers.LSTM(128, return_sequences=True, dropout=0.2, recurrent_dropout=0.1, name='lstm_1')
+        layers.LSTM(128, return_sequences=True, dropout=0.2, recurrent_dropout=0.0, name='lstm_1')
     )(candles_input)
     x1 = layers.LayerNormalization(name='ln_lstm_1')(x1)
     
     # Second BiLSTM layer with residual connection
     x2 = layers.Bidirectional(
-        layers.LSTM(64, return_sequences=True, dropout=0.2, recurrent_dropout=0.1, name='lstm_2')
+        layers.LSTM(64, return_sequences=True, dropout=0.2, recurrent_dropout=0.0, name='lstm_2')
     )(x1)
     x2 = layers.LayerNormalization(name='ln_lstm_2')(x2)
     
@@ -196,9 +196,10 @@ def create_model(input_shapes: dict, batch_size: int = 64) -> Model:
     
     # ===== OUTPUT LAYERS (MULTI-TASK) =====
     
-    profitable_output = layers.Dense(1, activation='sigmoid', name='profitable')(fc3)
-    max_profit_output = layers.Dense(1, activation='linear', name='max_profit')(fc3)
-    rug_risk_output = layers.Dense(1, activation='sigmoid', name='rug_risk')(fc3)
+    # Heads stay float32 under mixed precision so the sigmoid/losses are numerically stable
+    profitable_output = layers.Dense(1, activation='sigmoid', dtype='float32', name='profitable')(fc3)
+    max_profit_output = layers.Dense(1, activation='linear', dtype='float32', name='max_profit')(fc3)
+    rug_risk_output = layers.Dense(1, activation='sigmoid', dtype='float32', name='rug_risk')(fc3)
     
     # ===== CREATE MODEL =====
     
@@ -211,7 +212,7 @@ def create_model(input_shapes: dict, batch_size: int = 64) -> Model:
     print(f"✅ Enhanced model created:")
     print(f"  - Architecture: BiLSTM + Scaled Attention + Residuals")
     print(f"  - Total parameters: {model.count_params():,}")
-    print(f"  - Trainable parameters: {sum([tf.size(w).numpy() for w in model.trainable_weights]):,}")
+    print(f"  - Trainable parameters: {sum(int(np.prod(w.shape)) for w in model.trainable_weights):,}")
     
     return model
 
@@ -257,7 +258,8 @@ def compile_model_with_class_weights(model: Model, y_train: np.ndarray):
             'profitable': ['accuracy', keras.metrics.AUC(name='auc'), keras.metrics.Precision(name='precision'), keras.metrics.Recall(name='recall')],
             'max_profit': ['mae', 'mse'],
             'rug_risk': ['accuracy', keras.metrics.AUC(name='auc')]
-        }
+        },
+        jit_compile=True  # XLA fuses the attention matmul/softmax chain and the LayerNorm/Add/Dropout residuals
     )
     
     return {
@@ -266,12 +268,60 @@ def compile_model_with_class_weights(model: Model, y_train: np.ndarray):
     }
 
 
+def make_dataset(X: dict, y: np.ndarray, batch_size: int, sample_weights: dict = None,
+                 shuffle: bool = False, rows: np.ndarray = None) -> tf.data.Dataset:
+    """
+    tf.data pipeline (inputs, per-head labels[, per-head sample weights]), batched and
+    prefetched so the next batch is prepared on the CPU while the GPU trains on the current one
+    
+    Only batch indices go through tf.data; rows are gathered straight from the (memory-mapped)
+    arrays per batch, so the full dataset is never copied into RAM or a tensor.
+    rows (sorted) maps split positions to rows of X when X holds the full unsplit arrays;
+    y and sample_weights are always per-split
+    """
+    heads = ('profitable', 'max_profit', 'rug_risk')
+    features = [X['candles'], X['context'], X['indicators']]
+    columns = [y[:, i] for i in range(len(heads))]
+    if sample_weights is not None:
+        columns += [sample_weights[head] for head in heads]
+    
+    def gather(idx):
+        idx = np.sort(idx)  # Ascending row order -> sequential reads from the memmap
+        feature_idx = idx if rows is None else rows[idx]
+        return ([np.asarray(col[feature_idx], dtype=np.float32) for col in features] +
+                [np.asarray(col[idx], dtype=np.float32) for col in columns])
+    
+    def to_elements(idx):
+        batch = tf.numpy_function(gather, [idx], [tf.float32] * (len(features) + len(columns)))
+        for tensor, col in zip(batch, features + columns):
+            tensor.set_shape((None,) + col.shape[1:])
+        inputs = tuple(batch[:3])
+        outputs = dict(zip(heads, batch[3:6]))
+        if sample_weights is None:
+            return inputs, outputs
+        return inputs, outputs, dict(zip(heads, batch[6:]))
+    
+    ds = tf.data.Dataset.range(len(y))
+    if shuffle:
+        ds = ds.shuffle(len(y), reshuffle_each_iteration=True).batch(batch_size, drop_remainder=True)
+    else:
+        ds = ds.batch(batch_size)
+    ds = ds.map(to_elements, num_parallel_calls=tf.data.AUTOTUNE)
+    
+    options = tf.data.Options()
+    options.experimental_optimization.map_and_batch_fusion = True
+    options.deterministic = not shuffle  # Keep batch order for val/test (predictions line up with labels)
+    return ds.with_options(options).prefetch(tf.data.AUTOTUNE)
+
+
 def train_model(model: Model, X_train: dict, y_train: np.ndarray, 
                 X_val: dict, y_val: np.ndarray, 
                 class_weights: dict,
-                epochs: int = 100, batch_size: int = 64):
+                epochs: int = 100, batch_size: int = 64,
+                train_rows: np.ndarray = None, val_rows: np.ndarray = None):
     """
     Train model with enhanced callbacks and class weights
+    (train_rows/val_rows: split row indices into X_* when those are the full arrays, see make_dataset)
     """
     print(f"\n🚀 Starting enhanced training...")
     print(f"  - Epochs: {epochs}, Batch size: {batch_size}")
@@ -318,7 +368,8 @@ def train_model(model: Model, X_train: dict, y_train: np.ndarray,
         # TensorBoard
         keras.callbacks.TensorBoard(
             log_dir=f'../../logs/tensorboard_v2_{datetime.now().strftime("%Y%m%d_%H%M%S")}',
-            histogram_freq=1,
+            histogram_freq=0,  # Scalars only: weight histograms cost an extra pass every epoch
+            profile_batch=0,
             write_graph=True,
             update_freq='epoch'
         ),
@@ -331,49 +382,30 @@ def train_model(model: Model, X_train: dict, y_train: np.ndarray,
         )
     ]
     
-    # Prepare inputs
-    X_train_inputs = [X_train['candles'], X_train['context'], X_train['indicators']]
-    X_val_inputs = [X_val['candles'], X_val['context'], X_val['indicators']]
-    
-    # Prepare outputs with class weights
-    y_train_outputs = {
-        'profitable': y_train[:, 0],
-        'max_profit': y_train[:, 1],
-        'rug_risk': y_train[:, 2]
-    }
-    y_val_outputs = {
-        'profitable': y_val[:, 0],
-        'max_profit': y_val[:, 1],
-        'rug_risk': y_val[:, 2]
-    }
-    
-    # Create sample weights for class balancing
-    sample_weight_profitable = np.array([class_weights['profitable'][int(y)] for y in y_train[:, 0]])
-    sample_weight_rug = np.array([class_weights['rug_risk'][int(y)] for y in y_train[:, 2]])
+    # Create sample weights for class balancing (table lookup indexed by the 0/1 label)
+    profitable_table = np.array([class_weights['profitable'].get(c, 1.0) for c in (0, 1)], dtype=np.float32)
+    rug_table = np.array([class_weights['rug_risk'].get(c, 1.0) for c in (0, 1)], dtype=np.float32)
+    sample_weight_profitable = profitable_table[y_train[:, 0].astype(np.int64)]
+    sample_weight_rug = rug_table[y_train[:, 2].astype(np.int64)]
     
     sample_weights = {
         'profitable': sample_weight_profitable,
-        'max_profit': np.ones(len(y_train)),  # No weighting for regression
+        'max_profit': np.ones(len(y_train), dtype=np.float32),  # No weighting for regression
         'rug_risk': sample_weight_rug
     }
     
-    # Train with mixed precision for speed
-    keras.mixed_precision.set_global_policy('mixed_float16')
+    # Input pipelines (sample weights travel with each batch)
+    train_ds = make_dataset(X_train, y_train, batch_size, sample_weights, shuffle=True, rows=train_rows)
+    val_ds = make_dataset(X_val, y_val, batch_size, rows=val_rows)
     
     history = model.fit(
-        X_train_inputs,
-        y_train_outputs,
-        validation_data=(X_val_inputs, y_val_outputs),
+        train_ds,
+        validation_data=val_ds,
         epochs=epochs,
-        batch_size=batch_size,
         callbacks=callbacks,
-        sample_weight=sample_weights,
         verbose=1
     )
     
-    # Reset to float32
-    keras.mixed_precision.set_global_policy('float32')
-    
     # Save training history
     with open('../../training_history_v2.json', 'w') as f:
         json.dump({
@@ -386,27 +418,23 @@ def train_model(model: Model, X_train: dict, y_train: np.ndarray,
     return history
 
 
-def evaluate_model(model: Model, X_test: dict, y_test: np.ndarray):
+def evaluate_model(model: Model, X_test: dict, y_test: np.ndarray, batch_size: int = 64,
+                   rows: np.ndarray = None):
     """
     Comprehensive model evaluation
     """
     print("\n📊 Evaluating enhanced model on test set...")
     
-    X_test_inputs = [X_test['candles'], X_test['context'], X_test['indicators']]
-    y_test_outputs = {
-        'profitable': y_test[:, 0],
-        'max_profit': y_test[:, 1],
-        'rug_risk': y_test[:, 2]
-    }
+    test_ds = make_dataset(X_test, y_test, batch_size, rows=rows)
     
-    results = model.evaluate(X_test_inputs, y_test_outputs, verbose=1)
+    results = model.evaluate(test_ds, verbose=1)
     
     print("\n📈 Test Results:")
     for i, metric_name in enumerate(model.metrics_names):
         print(f"  {metric_name}: {results[i]:.4f}")
     
     # Additional analysis
-    predictions = model.predict(X_test_inputs)
+    predictions = model.predict(test_ds)
     profitable_preds = (predictions[0] > 0.5).astype(int).flatten()
     rug_preds = (predictions[2] > 0.5).astype(int).flatten()
     
@@ -437,6 +465,41 @@ def export_for_inference(model: Model, output_dir: str = '../../tfjs_model_v2'):
     print(f"   Features: Scaled Attention, Residuals, Layer Norm")
 
 
+def export_tflite_int8(model: Model, X_sample: dict, output_path: str = '../../model_v2_int8.tflite',
+                       num_samples: int = 100):
+    """
+    Export a post-training INT8-quantized TFLite model for CPU inference (~4x smaller)
+    
+    X_sample provides the representative batches used to calibrate activation ranges;
+    inputs/outputs stay float32 so callers feed the same scaled features as the TFJS model
+    """
+    print(f"\n📦 Exporting INT8 TFLite model...")
+    
+    def representative_dataset():
+        for i in range(min(num_samples, len(X_sample['candles']))):
+            yield [np.asarray(X_sample[key][i:i + 1], dtype=np.float32)
+                   for key in ('candles', 'context', 'indicators')]
+    
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    # INT8 kernels where available; any op without one falls back to float instead of failing
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+    converter.inference_input_type = tf.float32
+    converter.inference_output_type = tf.float32
+    
+    try:
+        tflite_model = converter.convert()
+    except Exception as e:
+        print(f"⚠️ INT8 TFLite export failed, skipping: {e}")
+        return
+    
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    
+    print(f"✅ INT8 model exported to {output_path} ({len(tflite_model) / 1024:.0f} KB)")
+
+
 def main():
     """
     Main training pipeline for enhanced model
@@ -445,35 +508,33 @@ def main():
     print("🧠 Deep Learning Model Training V2 (Enhanced)")
     print("=" * 60)
     
-    # Load preprocessed data
+    # Load preprocessed data (memory-mapped .npy shards)
     print("\n📂 Loading preprocessed data...")
-    data = np.load('../../processed_data.npz')
-    
-    X_train = {
-        'candles': data['X_train_candles'],
-        'context': data['X_train_context'],
-        'indicators': data['X_train_indicators']
-    }
-    X_val = {
-        'candles': data['X_val_candles'],
-        'context': data['X_val_context'],
-        'indicators': data['X_val_indicators']
-    }
-    X_test = {
-        'candles': data['X_test_candles'],
-        'context': data['X_test_context'],
-        'indicators': data['X_test_indicators']
+    data = load_processed_data()
+    
+    # Features stay as the full memmaps (X_combined = context (5) + indicators (5) + patterns (8);
+    # column slices are views); each split is a sorted row-index array gathered per batch
+    X = {
+        'candles': data['X_candles'],
+        'context': data['X_combined'][:, :5],
+        'indicators': data['X_combined'][:, 5:10]
     }
+    train_idx, val_idx, test_idx = data['train_idx'], data['val_idx'], data['test_idx']
     
-    y_train = data['y_train']
-    y_val = data['y_val']
-    y_test = data['y_test']
+    y_train = data['y'][train_idx]
+    y_val = data['y'][val_idx]
+    y_test = data['y'][test_idx]
     
     print(f"✅ Data loaded:")
     print(f"  Train: {len(y_train):,} examples")
     print(f"  Val:   {len(y_val):,} examples")
     print(f"  Test:  {len(y_test):,} examples")
     
+    # Mixed precision must be set before the model is built: each layer fixes its compute dtype
+    # at construction (fp16 math, fp32 variables). CPU has no fast fp16 path, so GPU only
+    if tf.config.list_physical_devices('GPU'):
+        keras.mixed_precision.set_global_policy('mixed_float16')
+    
     # Create enhanced model
     input_shapes = {
         'candles': (100, 5),
@@ -492,18 +553,21 @@ def main():
     # Train model
     history = train_model(
         model, 
-        X_train, y_train, 
-        X_val, y_val,
+        X, y_train, 
+        X, y_val,
         class_weights,
         epochs=100,
-        batch_size=64
+        batch_size=64,
+        train_rows=train_idx,
+        val_rows=val_idx
     )
     
     # Evaluate on test set
-    evaluate_model(model, X_test, y_test)
+    evaluate_model(model, X, y_test, batch_size=64, rows=test_idx)
     
-    # Export for inference
+    # Export for inference (INT8 calibration on training rows only)
     export_for_inference(model)
+    export_tflite_int8(model, {key: values[train_idx[:100]] for key, values in X.items()})
     
     print("\n" + "=" * 60)
     print("✅ Enhanced training pipeline complete!")
@@ -0,0 +1,137 @@
+"""
+Numba kernels for candlestick pattern detection
+Same arithmetic as add_patterns_to_existing_data.detect_candlestick_patterns(),
+compiled and run in parallel across examples
+"""
+
+import numpy as np
+from numba import njit, prange
+from typing import Dict
+
+MIN_WICK_TO_BODY_RATIO = 2.0
+
+
+@njit(cache=True)
+def _context_score(candles: np.ndarray, liquidity: float) -> float:
+    """
+    calculate_context_score() for one (T, 5) OHLCV window
+    """
+    score = 0.0
+    n = candles.shape[0]
+
+    if n >= 20:
+        # 1. Trend analysis (price momentum over last 20 candles)
+        first_price = candles[n - 20, 3]
+        last_price = candles[n - 1, 3]
+        price_change = ((last_price - first_price) / first_price) * 100
+
+        if price_change > 10:
+            score += 0.30
+        elif price_change > 0:
+            score += 0.15
+        elif price_change < -10:
+            score += 0.10
+
+        # 2. Support/Resistance (price position in recent range)
+        recent_high = candles[n - 20, 1]
+        recent_low = candles[n - 20, 2]
+        for j in range(n - 19, n):
+            recent_high = max(recent_high, candles[j, 1])
+            recent_low = min(recent_low, candles[j, 2])
+        current_price = candles[n - 1, 3]
+
+        if recent_high != recent_low:
+            price_position = (current_price - recent_low) / (recent_high - recent_low)
+            if price_position < 0.20:
+                score += 0.25
+            elif price_position > 0.90:
+                score += 0.20
+
+    # 3. Liquidity context
+    if liquidity > 500000:
+        score += 0.20
+    elif liquidity > 100000:
+        score += 0.10
+
+    return min(score, 1.0)
+
+
+@njit(parallel=True, cache=True)
+def _detect_patterns_kernel(candles, liquidity, flags, wick_rejection, body_to_range, confidence, context_score):
+    for i in prange(candles.shape[0]):
+        n = candles.shape[1]
+        last_open = candles[i, n - 1, 0]
+        last_high = candles[i, n - 1, 1]
+        last_low = candles[i, n - 1, 2]
+        last_close = candles[i, n - 1, 3]
+
+        # Calculate candle metrics
+        body = abs(last_close - last_open)
+        upper_wick = last_high - max(last_close, last_open)
+        lower_wick = min(last_close, last_open) - last_low
+        total_range = last_high - last_low
+
+        is_bullish = last_close > last_open
+        is_bearish = last_close < last_open
+
+        ratio = body / total_range if total_range > 0 else 0.0
+        rejection = max(upper_wick, lower_wick) / body if body > 0 else 0.0
+        pattern_confidence = 0.0
+
+        # 1. Bullish pin bar
+        if lower_wick > body * MIN_WICK_TO_BODY_RATIO and is_bullish:
+            flags[i, 0] = True
+            wick_strength = (lower_wick / total_range) * 100 if total_range > 0 else 0.0
+            pattern_confidence = max(pattern_confidence, min(60 + wick_strength * 0.3, 80) / 100)
+
+        # 2. Bearish pin bar
+        if upper_wick > body * MIN_WICK_TO_BODY_RATIO and is_bearish:
+            flags[i, 1] = True
+            wick_strength = (upper_wick / total_range) * 100 if total_range > 0 else 0.0
+            pattern_confidence = max(pattern_confidence, min(60 + wick_strength * 0.3, 80) / 100)
+
+        # 3/4. Engulfing (engulfs at least 60% of previous body)
+        prev_body = abs(candles[i, n - 2, 3] - candles[i, n - 2, 0])
+        engulfs_previous = body > prev_body * 0.6
+
+        if is_bullish and engulfs_previous and ratio > 0.6:
+            flags[i, 2] = True
+            pattern_confidence = max(pattern_confidence, 0.65)
+
+        if is_bearish and engulfs_previous and ratio > 0.6:
+            flags[i, 3] = True
+            pattern_confidence = max(pattern_confidence, 0.65)
+
+        wick_rejection[i] = min(rejection, 10.0)  # Cap at 10 for stability
+        body_to_range[i] = ratio
+        confidence[i] = pattern_confidence
+        context_score[i] = _context_score(candles[i], liquidity[i])
+
+
+def detect_candlestick_patterns_numba(candles: np.ndarray, liquidity: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Pattern arrays for an (N, T, 5) OHLCV array and (N,) liquidity vector
+    Same keys as the per-example pattern dict
+    """
+    candles = np.ascontiguousarray(candles, dtype=np.float64)
+    liquidity = np.ascontiguousarray(liquidity, dtype=np.float64)
+    n = candles.shape[0]
+
+    flags = np.zeros((n, 4), dtype=np.bool_)
+    wick_rejection = np.empty(n, dtype=np.float64)
+    body_to_range = np.empty(n, dtype=np.float64)
+    confidence = np.empty(n, dtype=np.float64)
+    context_score = np.empty(n, dtype=np.float64)
+
+    _detect_patterns_kernel(candles, liquidity, flags, wick_rejection, body_to_range, confidence, context_score)
+
+    return {
+        'has_bullish_pin': flags[:, 0],
+        'has_bearish_pin': flags[:, 1],
+        'has_bullish_engulfing': flags[:, 2],
+        'has_bearish_engulfing': flags[:, 3],
+        'wick_rejection_ratio': wick_rejection,
+        'body_to_range_ratio': body_to_range,
+        'pattern_confidence': confidence,
+        'context_score': context_score,
+    }
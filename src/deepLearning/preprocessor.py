@@ -3,17 +3,142 @@ Data Preprocessing for Deep Learning Model
 Loads training data, scales features, splits dataset
 """
 
-import json
+import orjson
 import numpy as np
 import pickle
 import os
-from sklearn.preprocessing import RobustScaler, StandardScaler
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from typing import Tuple, Dict
 
 # Get root directory (2 levels up from this file)
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+
+def load_processed_data(path: str = None, mmap_mode: str = 'r') -> Dict[str, np.ndarray]:
+    """
+    Load preprocessor output as {key: array}
+    
+    Reads the .npy shards in processed_data/ memory-mapped (pages load on demand,
+    no extra copy in RAM); falls back to a legacy processed_data.npz
+    """
+    if path is None:
+        path = os.path.join(ROOT_DIR, 'processed_data')
+    
+    if os.path.isdir(path):
+        return {
+            name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+            for name in sorted(os.listdir(path)) if name.endswith('.npy')
+        }
+    
+    npz_path = path if path.endswith('.npz') else path + '.npz'
+    with np.load(npz_path) as data:
+        return dict(data)
+
+
+def load_split(data: Dict[str, np.ndarray], split: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (candles, combined, y) for split 'train' / 'val' / 'test' of load_processed_data() output
+    
+    Gathers the split's rows from the full arrays via its saved index array (only those rows
+    are read from the memmap); older outputs with per-split arrays are returned as-is
+    """
+    if f'{split}_idx' in data:
+        idx = data[f'{split}_idx']
+        return data['X_candles'][idx], data['X_combined'][idx], data['y'][idx]
+    return data[f'X_{split}_candles'], data[f'X_{split}_combined'], data[f'y_{split}']
+
+
+# Producers (dataCollector.ts, merge_data.py, add_patterns_to_existing_data.py) write one example per line
+_EXAMPLES_PREFIX = b'{"examples":[\n'
+_MIN_SHARD_BYTES = 16 * 1024 * 1024  # Below this a worker process costs more than it saves
+
+
+def _extract_arrays(examples: list) -> Dict[str, np.ndarray]:
+    """
+    Raw (unscaled) feature/label arrays for a list of parsed examples
+    """
+    # Extract features and labels into preallocated contiguous arrays
+    N = len(examples)
+    timesteps = len(examples[0]['candles']) if N else 100
+    X_candles = np.empty((N, timesteps, 5), dtype=np.float32)
+    X_context = np.empty((N, 5), dtype=np.float32)
+    X_indicators = np.empty((N, 5), dtype=np.float32)
+    X_patterns = np.zeros((N, 8), dtype=np.float32)  # NEW: Separate array for pattern features
+    
+    # Field getters built once: each call returns a tuple in feature order
+    get_candle = itemgetter('open', 'high', 'low', 'close', 'volume')
+    get_context = itemgetter('liquidity', 'marketCap', 'holders', 'age', 'volume24h')
+    get_indicators = itemgetter('rsi', 'macd', 'ema_fast', 'ema_slow', 'bbands_width')
+    get_patterns = itemgetter(
+        'has_bullish_pin', 'has_bearish_pin', 'has_bullish_engulfing', 'has_bearish_engulfing',
+        'wick_rejection_ratio', 'body_to_range_ratio', 'pattern_confidence', 'context_score'
+    )
+    
+    for i, example in enumerate(examples):
+        # Candles: (100, 5) - [open, high, low, close, volume]
+        X_candles[i] = list(map(get_candle, example['candles']))
+        
+        # Context: (5,) - [liquidity, marketCap, holders, age, volume24h]
+        X_context[i] = get_context(example['context'])
+        
+        # Indicators: (5,) - [rsi, macd, ema_fast, ema_slow, bbands_width]
+        X_indicators[i] = get_indicators(example['indicators'])
+        
+        # Patterns: (8,) - EmperorBTC candlestick patterns
+        # Check if pattern data exists (for backward compatibility)
+        # Fallback: zeros if no pattern data (will be trained once data is regenerated)
+        # Flat 8-element lists (inference.py input layout) are copied as-is, dicts go through the getter
+        patterns = example.get('patterns')
+        if patterns is not None:
+            X_patterns[i] = patterns if isinstance(patterns, list) else get_patterns(patterns)
+    
+    # Labels: one np.fromiter pass per label straight into a sized array (no list growth/copy)
+    labels = list(map(itemgetter('labels'), examples))
+    y_profitable = np.fromiter((bool(l['profitable']) for l in labels), dtype=np.float32, count=N)
+    y_max_profit = np.fromiter((l['max_profit'] for l in labels), dtype=np.float32, count=N)
+    y_rug_risk = np.fromiter((bool(l['rug_risk']) for l in labels), dtype=np.float32, count=N)
+    
+    return {
+        'X_candles': X_candles,
+        'X_context': X_context,
+        'X_indicators': X_indicators,
+        'X_patterns': X_patterns,
+        'y_profitable': y_profitable,
+        'y_max_profit': y_max_profit,
+        'y_rug_risk': y_rug_risk
+    }
+
+
+def _split_examples(raw: bytes, num_shards: int) -> list:
+    """
+    Cut the examples array of a one-example-per-line file into ~equal byte shards at line breaks
+    
+    Returns None when the file does not have that layout (caller parses it whole)
+    """
+    end = raw.rfind(b'\n]')
+    if not raw.startswith(_EXAMPLES_PREFIX) or end < len(_EXAMPLES_PREFIX):
+        return None
+    
+    start = len(_EXAMPLES_PREFIX)
+    bounds = [start]
+    for k in range(1, num_shards):
+        cut = raw.find(b'\n', start + (end - start) * k // num_shards, end)
+        if cut != -1 and cut + 1 > bounds[-1]:
+            bounds.append(cut + 1)
+    bounds.append(end)
+    return [raw[a:b] for a, b in zip(bounds, bounds[1:]) if raw[a:b].strip()]
+
+
+def _parse_shard(shard: bytes) -> Dict[str, np.ndarray]:
+    """
+    Worker: parse a shard of example lines ("{...},\n{...}") and extract its arrays
+    """
+    return _extract_arrays(orjson.loads(b'[' + shard.strip().rstrip(b',') + b']'))
+
+
 class DataPreprocessor:
     def __init__(self, data_path: str = None):
         if data_path is None:
@@ -23,10 +148,10 @@ class DataPreprocessor:
         self.data_path = data_path
         self.root_dir = ROOT_DIR
         
-        # Scalers for different feature types
-        self.candle_scaler = RobustScaler()  # Robust to outliers
-        self.context_scaler = StandardScaler()
-        self.indicator_scaler = StandardScaler()
+        # Scalers for different feature types (copy=False: scale the float32 arrays in place)
+        self.candle_scaler = None  # Robust (median/IQR) stats, fitted in _scale_candles
+        self.context_scaler = StandardScaler(copy=False)
+        self.indicator_scaler = StandardScaler(copy=False)
         
         print(f"📂 Loading data from {data_path}...")
         
@@ -35,87 +160,16 @@ class DataPreprocessor:
         Load training data and preprocess into model-ready format
         
         Returns:
-            X_train, X_val, X_test, y_train, y_val, y_test
+            X_candles, X_combined, y (full, unsplit), train_idx, val_idx, test_idx
         """
-        # Load JSON data (from checkpoint or full file)
-        with open(self.data_path, 'r') as f:
-            data = json.load(f)
-        
-        # Get examples array (checkpoint structure has it at root level)
-        examples = data.get('examples', data)
-        # Load JSON data
-        with open(self.data_path, 'r') as f:
-            data = json.load(f)
-        
-        examples = data['examples']
-        print(f"✅ Loaded {len(examples):,} examples")
-        
-        # Extract features and labels
-        X_candles = []
-        X_context = []
-        X_indicators = []
-        X_patterns = []  # NEW: Separate array for pattern features
-        y_profitable = []
-        y_max_profit = []
-        y_rug_risk = []
-        
-        for example in examples:
-            # Candles: (100, 5) - [open, high, low, close, volume]
-            candles = np.array([[c['open'], c['high'], c['low'], c['close'], c['volume']] 
-                               for c in example['candles']])
-            X_candles.append(candles)
-            
-            # Context: (5,) - [liquidity, marketCap, holders, age, volume24h]
-            context = np.array([
-                example['context']['liquidity'],
-                example['context']['marketCap'],
-                example['context']['holders'],
-                example['context']['age'],
-                example['context']['volume24h']
-            ])
-            X_context.append(context)
-            
-            # Indicators: (5,) - [rsi, macd, ema_fast, ema_slow, bbands_width]
-            indicators = np.array([
-                example['indicators']['rsi'],
-                example['indicators']['macd'],
-                example['indicators']['ema_fast'],
-                example['indicators']['ema_slow'],
-                example['indicators']['bbands_width']
-            ])
-            X_indicators.append(indicators)
-            
-            # Patterns: (8,) - EmperorBTC candlestick patterns
-            # Check if pattern data exists (for backward compatibility)
-            if 'patterns' in example:
-                patterns = np.array([
-                    1.0 if example['patterns']['has_bullish_pin'] else 0.0,
-                    1.0 if example['patterns']['has_bearish_pin'] else 0.0,
-                    1.0 if example['patterns']['has_bullish_engulfing'] else 0.0,
-                    1.0 if example['patterns']['has_bearish_engulfing'] else 0.0,
-                    example['patterns']['wick_rejection_ratio'],
-                    example['patterns']['body_to_range_ratio'],
-                    example['patterns']['pattern_confidence'],
-                    example['patterns']['context_score']
-                ])
-            else:
-                # Fallback: zeros if no pattern data (will be trained once data is regenerated)
-                patterns = np.zeros(8)
-            X_patterns.append(patterns)
-            
-            # Labels
-            y_profitable.append(1 if example['labels']['profitable'] else 0)
-            y_max_profit.append(example['labels']['max_profit'])
-            y_rug_risk.append(1 if example['labels']['rug_risk'] else 0)
-        
-        # Convert to numpy arrays
-        X_candles = np.array(X_candles)  # Shape: (N, 100, 5)
-        X_context = np.array(X_context)  # Shape: (N, 5)
-        X_indicators = np.array(X_indicators)  # Shape: (N, 5)
-        X_patterns = np.array(X_patterns)  # Shape: (N, 8)
-        y_profitable = np.array(y_profitable)  # Shape: (N,)
-        y_max_profit = np.array(y_max_profit)  # Shape: (N,)
-        y_rug_risk = np.array(y_rug_risk)  # Shape: (N,)
+        raw = self._load_raw_arrays()
+        X_candles = raw['X_candles']
+        X_context = raw['X_context']
+        X_indicators = raw['X_indicators']
+        X_patterns = raw['X_patterns']
+        y_profitable = raw['y_profitable']
+        y_max_profit = raw['y_max_profit']
+        y_rug_risk = raw['y_rug_risk']
         
         print(f"📊 Data shapes:")
         print(f"  Candles: {X_candles.shape}")
@@ -132,8 +186,8 @@ class DataPreprocessor:
         # Scale features
         print("⚙️ Scaling features...")
         X_candles_scaled = self._scale_candles(X_candles)
-        X_context_scaled = self.context_scaler.fit_transform(X_context)
-        X_indicators_scaled = self.indicator_scaler.fit_transform(X_indicators)
+        X_context_scaled = self.context_scaler.fit_transform(X_context).astype(np.float32, copy=False)
+        X_indicators_scaled = self.indicator_scaler.fit_transform(X_indicators).astype(np.float32, copy=False)
         
         # Combine context + indicators + patterns (5 + 5 + 8 = 18)
         X_combined = np.concatenate([X_context_scaled, X_indicators_scaled, X_patterns], axis=1)
@@ -161,23 +215,8 @@ class DataPreprocessor:
             stratify=y_profitable[temp_idx]
         )
         
-        # Create train/val/test sets
-        X_train = {
-            'candles': X_candles_scaled[train_idx],
-            'combined': X_combined[train_idx]  # 18 features: context + indicators + patterns
-        }
-        X_val = {
-            'candles': X_candles_scaled[val_idx],
-            'combined': X_combined[val_idx]
-        }
-        X_test = {
-            'candles': X_candles_scaled[test_idx],
-            'combined': X_combined[test_idx]
-        }
-        
-        y_train = y[train_idx]
-        y_val = y[val_idx]
-        y_test = y[test_idx]
+        # Keep one copy of the features: splits are (sorted) row indices, not gathered arrays
+        train_idx, val_idx, test_idx = np.sort(train_idx), np.sort(val_idx), np.sort(test_idx)
         
         print(f"✅ Split complete:")
         print(f"  Train: {len(train_idx):,} examples ({len(train_idx)/len(indices)*100:.1f}%)")
@@ -186,33 +225,86 @@ class DataPreprocessor:
         
         # Print label distribution
         print(f"\n📈 Label distribution:")
-        print(f"  Train - Profitable: {np.sum(y_train[:, 0])}/{len(y_train)} ({np.sum(y_train[:, 0])/len(y_train)*100:.1f}%)")
-        print(f"  Val   - Profitable: {np.sum(y_val[:, 0])}/{len(y_val)} ({np.sum(y_val[:, 0])/len(y_val)*100:.1f}%)")
-        print(f"  Test  - Profitable: {np.sum(y_test[:, 0])}/{len(y_test)} ({np.sum(y_test[:, 0])/len(y_test)*100:.1f}%)")
+        for name, idx in (('Train', train_idx), ('Val  ', val_idx), ('Test ', test_idx)):
+            profitable = np.sum(y_profitable[idx])
+            print(f"  {name} - Profitable: {profitable}/{len(idx)} ({profitable/len(idx)*100:.1f}%)")
+        
+        return X_candles_scaled, X_combined, y, train_idx, val_idx, test_idx
+    
+    def _load_raw_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Raw (unscaled) feature/label arrays, cached next to the JSON as an uncompressed .npz
+        
+        The cache is reused while it is newer than the JSON, so reruns skip the parse entirely
+        """
+        cache_path = os.path.splitext(self.data_path)[0] + '.cache.npz'
+        if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(self.data_path):
+            with np.load(cache_path) as cached:
+                raw = dict(cached)
+            print(f"⚡ Loaded {len(raw['y_profitable']):,} examples from cache {cache_path}")
+            return raw
+        
+        raw = self._parse_examples()
+        np.savez(cache_path, **raw)
+        print(f"💾 Cached raw arrays to {cache_path}")
+        return raw
+    
+    def _parse_examples(self, num_workers: int = None) -> Dict[str, np.ndarray]:
+        """
+        Parse the training JSON into raw arrays
+        
+        Large one-example-per-line files are cut into byte shards that worker processes
+        parse (orjson) and extract in parallel; anything else is parsed in one go
+        """
+        with open(self.data_path, 'rb') as f:
+            raw = f.read()
+        
+        num_shards = min(num_workers or os.cpu_count() or 1, len(raw) // _MIN_SHARD_BYTES)
+        shards = _split_examples(raw, num_shards) if num_shards > 1 else None
+        arrays = None
+        if shards:
+            try:
+                with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+                    parts = list(pool.map(_parse_shard, shards))
+                arrays = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+            except orjson.JSONDecodeError:
+                print("⚠️ Sharded parse failed (unexpected layout), parsing the whole file")
         
-        return X_train, X_val, X_test, y_train, y_val, y_test
+        if arrays is None:
+            data = orjson.loads(raw)
+            # Get examples array (checkpoint structure has it at root level)
+            arrays = _extract_arrays(data['examples'] if isinstance(data, dict) else data)
+        
+        print(f"✅ Loaded {len(arrays['y_profitable']):,} examples")
+        return arrays
     
     def _scale_candles(self, X_candles: np.ndarray) -> np.ndarray:
         """
-        Scale candle data using RobustScaler
+        Scale candle data with RobustScaler semantics: (x - median) / IQR per feature
         Handles outliers better than StandardScaler
         """
+        X_candles = np.ascontiguousarray(X_candles, dtype=np.float32)
         N, timesteps, features = X_candles.shape
         
-        # Reshape to (N * timesteps, features) for scaling
+        # Reshape to (N * timesteps, features) for scaling (a view, no copy)
         X_reshaped = X_candles.reshape(-1, features)
         
-        # Scale
-        X_scaled = self.candle_scaler.fit_transform(X_reshaped)
+        # Fit: per-feature median and 25-75 IQR (zero IQR -> 1, as sklearn does)
+        q25, median, q75 = np.percentile(X_reshaped, [25, 50, 75], axis=0)
+        iqr = q75 - q25
+        iqr[iqr == 0.0] = 1.0
+        self.candle_scaler = {'center_': median, 'scale_': iqr, 'n_features_in_': features}
         
-        # Reshape back to (N, timesteps, features)
-        X_candles_scaled = X_scaled.reshape(N, timesteps, features)
+        # Scale in place, in float32
+        X_reshaped -= median.astype(np.float32)
+        X_reshaped /= iqr.astype(np.float32)
         
-        return X_candles_scaled
+        return X_candles
     
     def save_scalers(self, output_path: str = None):
         """
         Save fitted scalers for inference
+        (candle_scaler is a plain dict of center_/scale_ arrays, the others sklearn scalers)
         """
         if output_path is None:
             output_path = os.path.join(self.root_dir, 'scalers.pkl')
@@ -227,25 +319,27 @@ class DataPreprocessor:
         
         print(f"💾 Saved scalers to {output_path}")
     
-    def save_processed_data(self, X_train, X_val, X_test, y_train, y_val, y_test, 
+    def save_processed_data(self, X_candles, X_combined, y, train_idx, val_idx, test_idx,
                            output_path: str = None):
         """
-        Save processed data to disk
+        Save processed data to disk as one .npy file per array (see load_processed_data / load_split)
+        
+        The feature/label arrays are written once; splits are stored as row-index arrays
         """
         if output_path is None:
-            output_path = os.path.join(self.root_dir, 'processed_data.npz')
-        np.savez_compressed(
-            output_path,
-            X_train_candles=X_train['candles'],
-            X_train_combined=X_train['combined'],
-            X_val_candles=X_val['candles'],
-            X_val_combined=X_val['combined'],
-            X_test_candles=X_test['candles'],
-            X_test_combined=X_test['combined'],
-            y_train=y_train,
-            y_val=y_val,
-            y_test=y_test
-        )
+            output_path = os.path.join(self.root_dir, 'processed_data')
+        os.makedirs(output_path, exist_ok=True)
+        
+        arrays = {
+            'X_candles': X_candles,
+            'X_combined': X_combined,
+            'y': y,
+            'train_idx': train_idx,
+            'val_idx': val_idx,
+            'test_idx': test_idx
+        }
+        for name, values in arrays.items():
+            np.save(os.path.join(output_path, f'{name}.npy'), values)
         
         print(f"💾 Saved processed data to {output_path}")
 
@@ -261,13 +355,13 @@ def main():
     preprocessor = DataPreprocessor()
     
     # Load and preprocess
-    X_train, X_val, X_test, y_train, y_val, y_test = preprocessor.load_and_preprocess()
+    X_candles, X_combined, y, train_idx, val_idx, test_idx = preprocessor.load_and_preprocess()
     
     # Save scalers for inference
     preprocessor.save_scalers()
     
     # Save processed data for training
-    preprocessor.save_processed_data(X_train, X_val, X_test, y_train, y_val, y_test)
+    preprocessor.save_processed_data(X_candles, X_combined, y, train_idx, val_idx, test_idx)
     
     print("\n✅ Preprocessing complete!")
     print("=" * 60)
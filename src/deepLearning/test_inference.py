@@ -14,4 +14,5 @@ example_input = {
     "patterns": [1, 0, 1, 0, 3.5, 0.7, 0.75, 0.6]  # bullish_pin, bearish_pin, etc.
 }
 
-print(json.dumps(example_input))
+json.dump(example_input, sys.stdout)
+sys.stdout.write('\n')